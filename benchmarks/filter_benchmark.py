@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark :py:class:`phrasal.PatternSentenceFilter` with the shipped rules (``pattern_sentence_filter.yaml``)
+against a naive evaluation of the same rules, i.e. running ``findall`` to completion on every pattern of every rule,
+in the order of the YAML file. It also measures the adaptive mode (``adaptive=True``), that reorders the rules
+while filtering, and :py:meth:`~phrasal.PatternSentenceFilter.filter_batch`, that evaluates most rules on the whole
+batch at once using numpy. All of them must give the exact same decisions.
+
+The sentences are a mix of well-formed sentences and typical web garbage (menus, links, symbols, enumerations...).
+
+Usage::
+
+    python benchmarks/filter_benchmark.py [-n NUMBER] [-r REPEAT]
+"""
+import argparse
+import random
+import timeit
+
+from phrasal import PatternSentenceFilter
+from phrasal.filterers.pattern_sentence_filter import Compare, Find
+
+WORDS = ['Zürich', 'isch', 'schön', 'de', 'Stadtrat', 'und', 'mir', 'händ', 'gäge', 'Bern', 'gspielt', 'hüt', 'am',
+         'Morge', 'gsi', 'aber', 'nöd', 'so', 'viel', 'Lüüt', 'mit', 'em', 'Velo', 'uf', 'Arbet', 'gange', 'wo']
+
+GARBAGE = [
+    lambda rnd, s: s[:rnd.randint(3, 20)],  # too short
+    lambda rnd, s: f'{s} https://www.example.com/page?id={rnd.randint(1, 999)}',  # links
+    lambda rnd, s: f'Home | News | Kontakt | {s}',  # menus
+    lambda rnd, s: ' '.join(w.capitalize() for w in s.split()),  # truecased
+    lambda rnd, s: f'{s} S P E L L E D',  # spelled words
+    lambda rnd, s: f'{s} © 2020 · Alle Rechte vorbehalten',  # symbols
+    lambda rnd, s: ', '.join(s.split()),  # enumerations
+    lambda rnd, s: f'{s} Jaaaaaaaaaaaa!!!',  # repeated letters
+    lambda rnd, s: f'Tel. 044 123 45 67, 8000 Zürich / {s}',  # numbers
+    lambda rnd, s: f'#{s.replace(" ", " #")}',  # hashtags
+]
+
+
+def gen_sentence(rnd):
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(5, 25))]
+    if rnd.random() < 0.3:
+        words.insert(rnd.randrange(len(words)), rnd.choice([',', '-', '(so)', '20', '3.5']))
+    words[0] = words[0].capitalize()
+    return ' '.join(words).replace(' ,', ',') + rnd.choice(['.', '.', '!', '?', '...'])
+
+
+def gen_sentences(n, garbage_ratio=0.5, seed=0):
+    rnd = random.Random(seed)
+    sentences = [gen_sentence(rnd) for _ in range(n)]
+    return [rnd.choice(GARBAGE)(rnd, s) if rnd.random() < garbage_ratio else s for s in sentences]
+
+
+def naive_is_invalid(logic, s):
+    # the evaluation of a single rule logic, materializing all the matches
+    if isinstance(logic, Compare):
+        return logic.ratio.is_out_of_range(len(logic.num.findall(s)) / (len(logic.denom.findall(s)) + 1))
+    if isinstance(logic, Find):
+        nb_matches = len(logic.pattern.findall(s))
+        if logic.count and logic.count.is_out_of_range(nb_matches):
+            return True
+        return bool(logic.ratio) and logic.ratio.is_out_of_range(nb_matches / len(s))
+    return logic.is_out_of_range(len(s))
+
+
+def naive_is_valid(rules, s):
+    for rule in rules:
+        if not any(naive_is_invalid(iff, s) for iff in rule.iff) and naive_is_invalid(rule.logic, s):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=10_000, help='number of sentences per profile')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    filterer = PatternSentenceFilter()
+
+    print(f'{"profile":10s} {"valid":>11s} {"naive":>10s} {"filterer":>10s} {"speedup":>8s} '
+          f'{"adaptive":>10s} {"speedup":>8s} {"batch":>10s} {"speedup":>8s}')
+    for profile, garbage_ratio in [('clean', 0.05), ('mixed', 0.5), ('garbage', 0.95)]:
+        sentences = gen_sentences(args.number, garbage_ratio)
+        adaptive_filterer = PatternSentenceFilter(adaptive=True)
+        run_naive = lambda: [naive_is_valid(filterer.rules, s) for s in sentences]
+        run_filterer = lambda: [filterer.is_valid(s) for s in sentences]
+        run_adaptive = lambda: [adaptive_filterer.is_valid(s) for s in sentences]
+        run_batch = lambda: filterer.filter_batch(sentences).tolist()
+
+        decisions = run_filterer()
+        assert decisions == run_naive() == run_adaptive() == run_batch()
+        naive = min(timeit.repeat(run_naive, number=1, repeat=args.repeat))
+        fast = min(timeit.repeat(run_filterer, number=1, repeat=args.repeat))
+        adaptive = min(timeit.repeat(run_adaptive, number=1, repeat=args.repeat))
+        batch = min(timeit.repeat(run_batch, number=1, repeat=args.repeat))
+        print(f'{profile:10s} {sum(decisions):5d}/{len(decisions):<5d} {naive * 1000:8.1f}ms {fast * 1000:8.1f}ms '
+              f'{naive / fast:7.2f}x {adaptive * 1000:8.1f}ms {naive / adaptive:7.2f}x '
+              f'{batch * 1000:8.1f}ms {naive / batch:7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
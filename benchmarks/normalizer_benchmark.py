@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark the trigger-character fast path of :py:func:`phrasal.norm_punc.normalize_text`, i.e. skipping the NFC
+normalization and all the patterns that can't match, against applying everything on every text.
+
+Usage::
+
+    python benchmarks/normalizer_benchmark.py [-n NUMBER]
+"""
+import argparse
+import random
+import timeit
+import unicodedata
+
+from phrasal import norm_punc
+
+PROFILES = dict(
+    ascii=[
+        'This is a plain ASCII sentence, as most of the ones we get.',
+        'Another one: with some punctuation (and parentheses) !',
+        'Numbers like 1,200 or 10 % are fine too.',
+        'Short line.',
+    ],
+    german=[
+        'Grüezi mitenand, hüt isch es schön gsi.',
+        'Dä Päter hät gseit: „Das isch super“ – öppe 20 km…',
+        'Mr. Müller (s’Huus) isch 10 % grösser, 1 000 Fr.',
+        'Die Straße führt über die Brücke.',
+    ],
+    emoji=[
+        'So cool 😀😀 see you soon 👍🏽',
+        '☕ time ☀️ and 🍕 for lunch 🎉🎉🎉',
+        'Hello ❤️ world 🌍, 🙈🙉🙊!',
+        'Nice ✨ day ✨',
+    ],
+)
+
+
+def normalize_text_no_fast_path(text, strip_emojis=False):
+    # same as normalize_text, but always applying NFC and every single pattern
+    text = unicodedata.normalize('NFC', text)
+    if strip_emojis:
+        text = norm_punc.emoji_pattern.sub(' ', text)
+    text = norm_punc.apply_patterns(text, norm_punc.compiled_patterns)
+    return norm_punc.strip_lines(text)
+
+
+def gen_lines(profile, n, seed=0):
+    rnd = random.Random(seed)
+    return [rnd.choice(PROFILES[profile]) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=10_000, help='number of lines per profile')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"profile":10s} {"mode":6s} {"baseline":>10s} {"fast path":>10s} {"speedup":>8s}')
+    for profile in PROFILES:
+        lines = gen_lines(profile, args.number)
+        document = '\n'.join(lines)
+        for mode, run_fast, run_baseline in [
+            ('lines',
+             lambda: [norm_punc.normalize_text(l, strip_emojis=True) for l in lines],
+             lambda: [normalize_text_no_fast_path(l, strip_emojis=True) for l in lines]),
+            ('doc',
+             lambda: norm_punc.normalize_text(document, strip_emojis=True),
+             lambda: normalize_text_no_fast_path(document, strip_emojis=True)),
+        ]:
+            assert run_fast() == run_baseline()
+            baseline = min(timeit.repeat(run_baseline, number=1, repeat=args.repeat))
+            fast = min(timeit.repeat(run_fast, number=1, repeat=args.repeat))
+            print(f'{profile:10s} {mode:6s} {baseline * 1000:8.1f}ms {fast * 1000:8.1f}ms {baseline / fast:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
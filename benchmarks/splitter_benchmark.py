@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Benchmark and compare :py:class:`phrasal.MosesSplitter` and :py:class:`phrasal.MocySplitter` (both engines)
+on several corpus profiles: clean prose, web text (lowercase sentence starts), long single paragraphs,
+URL-heavy text and ``:;``-heavy text.
+
+For each profile and splitter, it reports the throughput (sentences/s and MB/s) and the memory peak
+(using ``tracemalloc``). It then checks the outputs:
+
+* the two MocySplitter engines must give the exact same sentences;
+* each splitter must give the same sentences as the golden outputs stored in ``splitter_golden.json``
+  (use ``--update-golden`` after an intended change of behavior);
+* the number of sentences on which Mocy and Moses agree is reported, for information.
+
+The exit code is 1 if any check fails, so it can be used to catch regressions.
+
+Usage::
+
+    python benchmarks/splitter_benchmark.py [-s SCALE] [-r REPEAT] [--update-golden]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+from phrasal import MocySplitter, MosesSplitter
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'splitter_golden.json')
+
+WORDS = ['house', 'river', 'Zürich', 'people', 'weather', 'train', 'city', 'music', 'night', 'street', 'Bern',
+         'mountain', 'book', 'friend', 'summer', 'party', 'work', 'lake']
+ABBREVIATIONS = ['Mr.', 'Dr.', 'i.e.', 'e.g.', 'Jan.', 'No.', 'U.S.A.', 'etc.', 'Prof.', 'z.B.']
+URLS = ['https://example.com', 'http://www.derlin.ch/a:b', 'www.swisstext.ch/page?id=3', 'https://x.org/1.2.3',
+        'mail@example.com', 'arXiv:1912.00159']
+
+
+def _sentence(rnd, lower=False, extra=()):
+    words = [rnd.choice(WORDS + list(extra)) for _ in range(rnd.randint(3, 15))]
+    if rnd.random() < 0.3:
+        words.insert(rnd.randrange(len(words)), rnd.choice(ABBREVIATIONS))
+    if rnd.random() < 0.2:
+        words.insert(rnd.randrange(len(words)), f'{rnd.randint(1, 2020)}.')
+    first = words[0] if lower else words[0][0].upper() + words[0][1:]
+    return ' '.join([first] + words[1:]) + rnd.choice(['.', '.', '.', '!', '?', '...'])
+
+
+def gen_prose(rnd, n):
+    # well-formed paragraphs of a few sentences, one per line
+    return '\n'.join(' '.join(_sentence(rnd) for _ in range(rnd.randint(1, 6))) for _ in range(n))
+
+
+def gen_web(rnd, n):
+    # lowercase sentence starts, repeated punctuation, quotes and smileys
+    def sentence():
+        s = _sentence(rnd, lower=rnd.random() < 0.6)
+        if rnd.random() < 0.3:
+            s = s[:-1] + rnd.choice(['!!!', '??', '?!', ' :)', ' ;-)', '!! 😀'])
+        if rnd.random() < 0.2:
+            s = f'"{s}"' if rnd.random() < 0.5 else f'({s})'
+        return s
+
+    return '\n'.join(' '.join(sentence() for _ in range(rnd.randint(1, 6))) for _ in range(n))
+
+
+def gen_long(rnd, n):
+    # everything in one long paragraph, like what BsConverter produces when joining with spaces
+    return ' '.join(_sentence(rnd) for _ in range(n * 4))
+
+
+def gen_urls(rnd, n):
+    # lots of URLs, emails and references (with colons and dots)
+    return '\n'.join(
+        ' '.join(_sentence(rnd, extra=URLS * 2) + (f' See {rnd.choice(URLS)}.' if rnd.random() < 0.5 else '')
+                 for _ in range(rnd.randint(1, 4)))
+        for _ in range(n))
+
+
+def gen_colons(rnd, n):
+    # enumerations and clauses delimited by :;, plus numbers like 1:1 and smileys
+    def sentence():
+        parts = [_sentence(rnd)[:-1] for _ in range(rnd.randint(2, 4))]
+        return rnd.choice([': ', '; ', ':', ' ; ']).join(parts) + rnd.choice(['.', ' 1:1.', ' ;-)', ':'])
+
+    return '\n'.join(' '.join(sentence() for _ in range(rnd.randint(1, 3))) for _ in range(n))
+
+
+PROFILES = dict(prose=gen_prose, web=gen_web, long=gen_long, urls=gen_urls, colons=gen_colons)
+
+SPLITTERS = dict(
+    moses=lambda: MosesSplitter(lang='en', more=True),
+    mocy=lambda: MocySplitter(more=True, engine='regex'),
+    mocy_scan=lambda: MocySplitter(more=True, engine='scan'),
+)
+
+
+def gen_corpus(profile, n=40):
+    """Generate the (deterministic) corpus of a profile, with ``n`` paragraphs."""
+    return PROFILES[profile](random.Random(profile), n)
+
+
+def measure(splitter, text, repeat):
+    # return the best time and the memory peak of splitting text
+    elapsed = min(timeit.repeat(lambda: splitter.split(text), number=1, repeat=repeat))
+    tracemalloc.start()
+    splitter.split(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def agreement(a, b):
+    # the number of sentences found by both a and b (as a multiset)
+    counts = dict()
+    for s in a:
+        counts[s] = counts.get(s, 0) + 1
+    common = 0
+    for s in b:
+        if counts.get(s, 0) > 0:
+            counts[s] -= 1
+            common += 1
+    return common
+
+
+def first_difference(a, b):
+    return next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--scale', type=int, default=50,
+                        help='how many times to repeat the golden corpus for throughput measures')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-p', '--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument('--update-golden', default=False, action='store_true',
+                        help=f'overwrite the golden outputs ({os.path.basename(GOLDEN_FILE)}) with the current ones')
+    args = parser.parse_args()
+
+    splitters = {name: create() for name, create in SPLITTERS.items()}
+    golden = dict()
+    if os.path.exists(GOLDEN_FILE):
+        with open(GOLDEN_FILE, encoding='utf-8') as f:
+            golden = json.load(f)
+
+    failures = []
+    print(f'{"profile":8s} {"splitter":10s} {"sentences":>9s} {"time":>9s} {"sent/s":>9s} {"MB/s":>6s} '
+          f'{"peak mem":>9s}  golden')
+
+    for profile in args.profiles:
+        corpus = gen_corpus(profile)
+        # repeat the corpus as separate paragraphs, so the output is the golden one repeated
+        text = '\n\n'.join([corpus] * args.scale)
+        megabytes = len(text.encode('utf-8')) / 1e6
+        outputs = dict()
+
+        for name, splitter in splitters.items():
+            outputs[name] = splitter.split(corpus)
+            expected = golden.get(profile, {}).get(name)
+            if args.update_golden:
+                golden.setdefault(profile, dict())[name] = outputs[name]
+                status = 'updated'
+            elif expected is None:
+                status = 'missing'
+            elif expected == outputs[name]:
+                status = 'ok'
+            else:
+                status = f'DIFF at #{first_difference(expected, outputs[name])}'
+                failures.append(f'{profile}/{name} differs from the golden outputs')
+
+            elapsed, peak = measure(splitter, text, args.repeat)
+            count = len(outputs[name]) * args.scale
+            print(f'{profile:8s} {name:10s} {count:9d} {elapsed * 1000:7.1f}ms {count / elapsed:9.0f} '
+                  f'{megabytes / elapsed:6.2f} {peak / 1e6:7.2f}MB  {status}')
+
+        if outputs['mocy'] != outputs['mocy_scan']:
+            failures.append(f'{profile}: the regex and scan engines differ at sentence '
+                            f'#{first_difference(outputs["mocy"], outputs["mocy_scan"])}')
+        common = agreement(outputs['mocy'], outputs['moses'])
+        print(f'{profile:8s} mocy/moses agree on {common}/{len(outputs["mocy"])} sentences\n')
+
+    if args.update_golden:
+        with open(GOLDEN_FILE, 'w', encoding='utf-8') as f:
+            json.dump(golden, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f'Golden outputs written to {GOLDEN_FILE}')
+
+    for failure in failures:
+        print(f'FAILED: {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
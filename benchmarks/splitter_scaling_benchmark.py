@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark how the splitters scale with the size of their input, on one long single paragraph (e.g. what
+:py:class:`phrasal.BsConverter` produces when joining everything with spaces) and on many short paragraphs.
+The time per KB should stay about the same for all sizes.
+
+Usage::
+
+    python benchmarks/splitter_scaling_benchmark.py [-s SIZE [SIZE ...]]
+"""
+import argparse
+import random
+import timeit
+
+from phrasal import MocySplitter, MosesSplitter
+
+SENTENCES = [
+    'This is a sentence, with Mr. Smith and Dr. Who.',
+    'Grüezi mitenand: hüt isch es schön gsi!',
+    'Is it really 3.5 km. away?',
+    '"I love this!" she said... Then she left.',
+    'see the U.S.A. on Jan. 16th or No. 14 (or not).',
+    'Another one; and yet another one.',
+]
+
+
+def gen_sentences(size, seed=0):
+    # generate about size characters worth of sentences
+    rnd = random.Random(seed)
+    sentences, total = [], 0
+    while total < size:
+        sentences.append(rnd.choice(SENTENCES))
+        total += len(sentences[-1]) + 1
+    return sentences
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[25_000, 50_000, 100_000, 200_000],
+                        help='input sizes, in characters')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    splitters = [
+        ('mocy', MocySplitter(more=True, keep_newlines=True)),
+        ('mocy-scan', MocySplitter(more=True, keep_newlines=True, engine='scan')),
+        ('mocy-text', MocySplitter(more=True, keep_newlines=False)),
+        ('moses', MosesSplitter(more=True)),
+    ]
+
+    print(f'{"splitter":10s} {"input":12s} {"size":>8s} {"time":>10s} {"per KB":>10s}')
+    for name, splitter in splitters:
+        # paragraphs are delimited by newlines in keep_newlines mode, by empty lines otherwise
+        separator = '\n' if name.startswith('mocy') and splitter.keep_newlines else '\n\n'
+        for size in args.sizes:
+            sentences = gen_sentences(size)
+            for kind, text in [('paragraph', ' '.join(sentences)), ('paragraphs', separator.join(sentences))]:
+                elapsed = min(timeit.repeat(lambda: splitter.split(text), number=1, repeat=args.repeat))
+                print(f'{name:10s} {kind:12s} {len(text) // 1000:6d}KB {elapsed * 1000:8.1f}ms '
+                      f'{elapsed * 1e6 / (len(text) / 1000):8.1f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -45,6 +45,7 @@ setuptools.setup(
     ],
     # extra dependencies
     extras_require={
-        'showcase': ['streamlit']
+        'showcase': ['streamlit'],
+        'batch': ['numpy'],
     }
 )
@@ -6,7 +6,7 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from .html_converters import *
 from .filterers import *
 from .splitters import *
-from .norm_punc import Normalizer, normalize_text
+from .norm_punc import Normalizer, normalize_text, normalize_stream
 
 from .interfaces import IHtmlConverter, ISplitter, INormalizer, IFilterer
 
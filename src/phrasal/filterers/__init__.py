@@ -1 +1,2 @@
-from .pattern_sentence_filter import PatternSentenceFilter
\ No newline at end of file
+from .pattern_sentence_filter import PatternSentenceFilter
+from .incremental_filter import IncrementalFilter
@@ -0,0 +1,213 @@
+"""
+This module helps tuning the rules of :py:class:`~phrasal.PatternSentenceFilter` on large corpora: instead of filtering
+the whole corpus again after each change of the rules, it only evaluates the rules that changed and outputs the
+sentences that flip, i.e. the sentences newly accepted and newly rejected.
+
+How it works
+------------
+The outcome of each rule on each sentence (rejected or not) is stored as a bit matrix (see :py:class:`RuleOutcomes`).
+Rules are identified by their fingerprint, i.e. what they check (``if`` condition, logic and timeout) and not their
+position, name or description. On the next run:
+
+* rules with the same fingerprint are not evaluated again, their outcomes are reused;
+* new or modified rules are evaluated on the whole corpus;
+* the outcomes of removed rules are dropped.
+
+Without stored outcomes (first run), all the sentences are considered previously accepted, so the output is
+the list of sentences rejected by the rules.
+
+The corpus is processed in chunks, and a digest of each chunk is stored along with the outcomes, to ensure the
+corpus didn't change in between. Rules using only length bounds and patterns made of a single character class are
+evaluated on whole chunks at once (see :py:meth:`~phrasal.PatternSentenceFilter.filter_batch`).
+
+.. note::
+
+    This module requires numpy (``pip install .[batch]``).
+
+Usage::
+
+    # first run: evaluate all the rules, output the rejected sentences (prefixed by -)
+    python -m phrasal IncrementalFilter -i corpus.txt -s corpus.outcomes.npz -r rules.yaml -o rejected.txt
+    # edit rules.yaml, then output the sentences that flip, prefixed by + (accepted) or - (rejected)
+    python -m phrasal IncrementalFilter -i corpus.txt -s corpus.outcomes.npz -r rules.yaml -o delta.txt
+
+"""
+
+import hashlib
+import itertools
+import logging
+from os import path
+
+from .pattern_sentence_filter import BatchFeatures, Rules, SentenceFeatures
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class RuleOutcomes:
+    """
+    The outcome of each rule on each sentence of a corpus. Rows are rules, identified by their fingerprint, and
+    columns are sentences, packed into bytes (see ``numpy.packbits``). A bit is set if the rule rejected the sentence.
+    """
+
+    def __init__(self, fingerprints, rejected, size, chunk_size, digests):
+        #: the fingerprint of each rule (row), see :py:meth:`IncrementalFilter.fingerprint`
+        self.fingerprints = list(fingerprints)
+        #: the packed bit matrix, with one row per rule
+        self.rejected = rejected
+        #: the number of sentences in the corpus
+        self.size = size
+        #: the number of sentences in each chunk (a multiple of 8)
+        self.chunk_size = chunk_size
+        #: the digest of each chunk of sentences
+        self.digests = list(digests)
+        #: the fingerprints of the rules evaluated when computing these outcomes (the others were reused)
+        self.evaluated = []
+
+    def valid(self):
+        """Return a numpy boolean array, true for the sentences accepted by all the rules."""
+        return ~np.unpackbits(np.bitwise_or.reduce(self.rejected, axis=0), count=self.size).astype(bool)
+
+    def save(self, filepath):
+        """Save the outcomes to a (compressed) numpy ``.npz`` file."""
+        with open(filepath, 'wb') as f:  # with a path, numpy would add a .npz extension
+            np.savez_compressed(f, fingerprints=np.array(self.fingerprints, dtype=str), rejected=self.rejected,
+                                size=self.size, chunk_size=self.chunk_size, digests=np.array(self.digests, dtype=str))
+
+    @classmethod
+    def load(cls, filepath) -> 'RuleOutcomes':
+        """Load outcomes saved using :py:meth:`save`."""
+        with np.load(filepath, allow_pickle=False) as data:
+            return cls(data['fingerprints'].tolist(), data['rejected'], int(data['size']), int(data['chunk_size']),
+                       data['digests'].tolist())
+
+    def __repr__(self):
+        return "RuleOutcomes(rules=%d, sentences=%d)" % (len(self.fingerprints), self.size)
+
+
+class IncrementalFilter:
+    """
+    Filter a corpus with the rules of a :py:class:`~phrasal.PatternSentenceFilter`, reusing the outcomes of the
+    rules that didn't change since the last run.
+    """
+
+    def __init__(self, rulespath=None, timeout=None, on_timeout='reject', chunk_size=8192):
+        """
+        :param rulespath: the path to the YAML rules, see :py:class:`~phrasal.PatternSentenceFilter`
+        :param timeout: the timeout of the rules, see :py:class:`~phrasal.PatternSentenceFilter`
+        :param on_timeout: the timeout policy, see :py:class:`~phrasal.PatternSentenceFilter`
+        :param chunk_size: the number of sentences processed at once, rounded up to a multiple of 8
+            (ignored if outcomes are reused, the chunks must be the same)
+        """
+        if np is None:
+            raise ImportError('incremental_filter.py requires the numpy package: pip install numpy.')
+        if rulespath is None:
+            rulespath = path.join(path.dirname(path.realpath(__file__)), 'pattern_sentence_filter.yaml')
+        self.rulespath = rulespath
+        self.rules = Rules.from_file(rulespath, timeout=timeout, on_timeout=on_timeout)
+        self.chunk_size = -(-chunk_size // 8) * 8
+
+    def fingerprint(self, rule) -> str:
+        """Return the fingerprint of a rule: same fingerprint, same outcomes."""
+        # the timeout policy only matters for rules with a timeout. A pattern shared with other rules gets the
+        # highest of their timeouts (see Rules.pattern_timeouts), so the effective ones matter too
+        if rule.timeout is None:
+            return rule.fingerprint
+        timeouts = [self.rules.pattern_timeouts.get(p) for p in dict.fromkeys(rule.patterns())]
+        return f'{rule.fingerprint}:{self.rules.on_timeout}:{timeouts}'
+
+    def refilter(self, sentences, previous: RuleOutcomes = None):
+        """
+        Evaluate the rules on the sentences, reusing the previous outcomes of the rules that didn't change.
+
+        :param sentences: an iterable of sentences, the same ones as the previous outcomes (if any)
+        :param previous: the outcomes of the previous run, if any
+        :return: a tuple ``(outcomes, changes)``, with changes a list of ``(index, sentence, accepted)`` for the
+            sentences that flipped, ``accepted`` being true if the sentence is now valid
+        :raises ValueError: if the sentences are not the ones of the previous outcomes
+        """
+        fingerprints = [self.fingerprint(r) for r in self.rules]
+        reused = dict() if previous is None else {f: i for i, f in enumerate(previous.fingerprints)}
+        todo = [(i, r) for i, r in enumerate(self.rules) if fingerprints[i] not in reused]
+        batch = [(i, r) for i, r in todo if all(p in self.rules.char_classes for p in r.patterns())]
+        others = [(i, r) for i, r in todo if (i, r) not in batch]
+        chunk_size = self.chunk_size if previous is None else previous.chunk_size
+
+        chunks, digests, changes = [], [], []
+        size = 0
+        sentences = iter(sentences)
+        for chunk in iter(lambda: list(itertools.islice(sentences, chunk_size)), []):
+            digest = hashlib.sha256('\n'.join(chunk).encode('utf-8', 'surrogatepass')).hexdigest()
+            old = None
+            if previous is not None:
+                if len(digests) >= len(previous.digests) or previous.digests[len(digests)] != digest:
+                    raise ValueError(f'The sentences differ from the previous ones in chunk #{len(digests)}.')
+                old = np.unpackbits(previous.rejected[:, size // 8:(size + len(chunk) + 7) // 8], axis=1,
+                                    count=len(chunk)).astype(bool)
+
+            # one row per rule, copying the previous outcomes of the rules that didn't change
+            rejected = np.zeros((len(fingerprints), len(chunk)), dtype=bool)
+            for i, f in enumerate(fingerprints):
+                if f in reused:
+                    rejected[i] = old[reused[f]]
+            if batch:
+                features = BatchFeatures(chunk)
+                for i, r in batch:
+                    rejected[i] = r.is_invalid_batch(features, self.rules.char_classes)
+            for j, sentence in enumerate(chunk):
+                features = SentenceFeatures(sentence, self.rules.pattern_timeouts)
+                for i, r in others:
+                    rejected[i, j] = self.rules.rejects(r, sentence, features)
+
+            was_valid = np.ones(len(chunk), dtype=bool) if old is None else ~old.any(axis=0)
+            valid = ~rejected.any(axis=0)
+            for j in np.flatnonzero(valid != was_valid).tolist():
+                changes.append((size + j, chunk[j], bool(valid[j])))
+
+            chunks.append(np.packbits(rejected, axis=1))
+            digests.append(digest)
+            size += len(chunk)
+
+        if previous is not None and size != previous.size:
+            raise ValueError(f'Expected {previous.size} sentences, got {size}.')
+        rejected = np.concatenate(chunks, axis=1) if chunks else np.zeros((len(fingerprints), 0), dtype=np.uint8)
+        outcomes = RuleOutcomes(fingerprints, rejected, size, chunk_size, digests)
+        outcomes.evaluated = [fingerprints[i] for i, _ in todo]
+        return outcomes, changes
+
+
+def main():
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', type=argparse.FileType('r'), default='-',
+                        help='the corpus, one sentence per line')
+    parser.add_argument('-o', '--out', type=argparse.FileType('w'), default='-')
+    parser.add_argument('-s', '--state', required=True,
+                        help='the .npz file storing the outcomes of the rules (created if it does not exist)')
+    parser.add_argument('-r', '--rules-file', default=None)
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help='maximum time (in seconds) to count each pattern of a rule on a sentence')
+    parser.add_argument('--on-timeout', choices=Rules.timeout_policies, default='reject')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(levelname)s: %(msg)s')
+
+    incremental = IncrementalFilter(args.rules_file, timeout=args.timeout, on_timeout=args.on_timeout)
+    previous = RuleOutcomes.load(args.state) if os.path.exists(args.state) else None
+    outcomes, changes = incremental.refilter((line.rstrip('\n') for line in args.input), previous)
+
+    for _, sentence, accepted in changes:
+        args.out.write(f'{"+" if accepted else "-"}\t{sentence}\n')
+    outcomes.save(args.state)
+
+    accepted = sum(accepted for _, _, accepted in changes)
+    logger.info(f'{len(outcomes.evaluated)}/{len(outcomes.fingerprints)} rules evaluated on {outcomes.size} '
+                f'sentences: {accepted} newly accepted, {len(changes) - accepted} newly rejected.')
@@ -1,4 +1,4 @@
-"""
+r"""
 This module contains an implementation of :py:class:`~swisstext.cmd.scraping.interfaces.ISentenceFilter` that uses
 simple rules to filter "well-formed" sentences.
 
@@ -8,13 +8,14 @@ Each sentence is checked against a list of rules and rejected / considered inval
 Rules are thus *AND-based*.
 
 Rules are defined using a simple YAML syntax and can be of two types: *length-based* (character count)
- or *pattern-based* (regular expressions). They are checked in the same order they are defined.
+ or *pattern-based* (regular expressions). Length-based rules are checked first, then the others in the same order
+they are defined (see :py:class:`Rules` for the details and the options).
 
 .. note::
 
     * Regular expressions can be quite expensive, so try to limit their complexity to the minimum required.
-    * Rules are checked in the same order as they are defined, so it is advised to put the most generic / efficient
-      ones first.
+    * Pattern-based rules are checked in the same order as they are defined, so it is advised to put the most
+      generic / efficient ones first.
 
 .. note::
 
@@ -111,17 +112,207 @@ Rules can additionnally specify ``examples`` and ``counterexamples`` that could
       counterexamples:
         - 'this is O K :)'
 
+Any rule can also set a ``timeout``, overriding the one of the filterer (``timeout: null`` to disable it):
+
+.. code-block:: yaml
+
+    - user_pattern:
+      descr: some complex pattern
+      timeout: 0.5
+      find:
+        pattern: '(\p{Lu}\p{Ll}+ ?)+!'
+        count:
+          max: 0
+
 """
 
+import copy
+import hashlib
+import itertools
+import json
+import os
 import regex
+import sys
 import yaml
 import logging
+import time
 from os import path
 
 from ..interfaces import IFilterer
+from ..utils import LRUCache
+from ..regex_utils import compile_pattern, dump_compiled, load_compiled, nested_quantifiers
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only required by filter_batch
+    np = None
 
 logger = logging.getLogger(__name__)
 
+# a single character class (or literal), optionally followed by a greedy quantifier
+_char_class_syntax = regex.compile(r'''
+    (?P<klass>
+        \\[pP]\{[^}]+\}                                    # unicode property
+      | \\[dDsSwWtnrfv]                                    # shorthand or control character
+      | \\x[0-9a-fA-F]{2} | \\u[0-9a-fA-F]{4} | \\U[0-9a-fA-F]{8}
+      | \\[^\w\s]                                          # escaped symbol
+      | \[\^?[^\]\[\\]?(?:\\.|[^\]\[\\])*\]                  # character set
+      | [^\\\[\](){}.*+?|^$\s] | [ ] | \.                    # literal or any character
+    )
+    (?P<quantifier> \+ | \{(?P<n>[1-9]\d*)(?P<comma>,(?P<m>\d*))?\} )?
+''', regex.VERBOSE)
+
+
+_no_options = dict()
+
+# before Python 3.7, sub skips the empty matches adjacent to a previous match (findall doesn't), in re and regex
+_subn_counts_all = sys.version_info >= (3, 7)
+
+
+def count_matches(pattern, s, limit=None, timeout=None) -> int:
+    """
+    Count the matches of a compiled pattern in s, i.e. ``len(pattern.findall(s))`` without building the list of
+    matches (and their groups).
+
+    :param pattern: the compiled pattern
+    :param s: the string to search
+    :param limit: if set, stop counting after ``limit`` matches, i.e. return ``min(count, limit)``
+    :param timeout: if set, raise a :py:class:`TimeoutError` if counting takes more than ``timeout`` seconds
+        (the pattern must be compiled with regex)
+    :return: the number of matches
+    """
+    options = _no_options if timeout is None else dict(timeout=timeout)
+    if limit is None and _subn_counts_all:
+        # substituting with an empty string counts in C, faster than iterating over finditer in Python
+        return pattern.subn('', s, **options)[1]
+    if limit == 1:
+        # the most common case (max: 0), a single search is enough
+        return 0 if pattern.search(s, **options) is None else 1
+    n = 0
+    if limit is None or limit > 0:
+        for _ in pattern.finditer(s, **options):
+            n += 1
+            if n == limit:
+                break
+    return n
+
+
+class SentenceFeatures:
+    """
+    The features of one sentence, computed lazily and at most once. They are shared by all the rules
+    (and their ``if`` conditions) evaluated on the sentence, so a pattern used by several rules is only counted once.
+    """
+    __slots__ = ('sentence', 'length', 'counts', 'timeouts')
+
+    def __init__(self, sentence, timeouts=None):
+        self.sentence = sentence
+        #: the length of the sentence, in characters
+        self.length = len(sentence)
+        #: the number of matches of each pattern counted so far (-1 if it timed out)
+        self.counts = dict()
+        #: the maximum time to count each pattern, in seconds (see :py:attr:`Rules.pattern_timeouts`)
+        self.timeouts = timeouts
+
+    def count(self, pattern, limit=None) -> int:
+        """
+        Return the number of matches of the compiled pattern in the sentence, or ``min(count, limit)`` if limit is set.
+        The limit must be the same for all the calls with the same pattern (see :py:class:`Rules`).
+        Raise a :py:class:`TimeoutError` if counting the pattern timed out (now or in a previous call).
+        """
+        n = self.counts.get(pattern)
+        if n is None:
+            timeout = self.timeouts.get(pattern) if self.timeouts else None
+            try:
+                n = self.counts[pattern] = count_matches(pattern, self.sentence, limit, timeout)
+            except TimeoutError:
+                self.counts[pattern] = -1  # don't waste time trying again for the other rules
+                raise
+        elif n < 0:
+            raise TimeoutError(f'counting {pattern.pattern} timed out')
+        return n
+
+
+def parse_char_class(pattern: str):
+    """
+    Check if a pattern only matches runs of a single character class, i.e. ``X``, ``X+``, ``X{n}``, ``X{n,}`` or
+    ``X{n,m}`` where ``X`` is a literal, a character set, a shorthand like ``\\s`` or a unicode property.
+
+    :return: a tuple ``(X, n, m)`` with ``X`` compiled and ``m`` None if unbounded, or None if the pattern is
+        anything else
+    """
+    match = _char_class_syntax.fullmatch(pattern)
+    if match is None:
+        return None
+    if match['quantifier'] is None:
+        n = m = 1
+    elif match['quantifier'] == '+':
+        n, m = 1, None
+    else:
+        n = int(match['n'])
+        m = n if match['comma'] is None else int(match['m']) if match['m'] else None
+        if m is not None and m < n:
+            return None
+    return regex.compile(match['klass']), n, m
+
+
+class BatchFeatures:
+    """
+    The features of a batch of sentences, as numpy arrays with one value per sentence. Patterns must be parsed
+    with :py:func:`parse_char_class`: they are counted on the whole batch at once, from a mask telling which
+    characters belong to their class.
+    """
+
+    def __init__(self, sentences):
+        self.sentences = sentences
+        #: the length of each sentence, in characters
+        self.length = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+        #: the end offset of each sentence in the concatenated text
+        self.ends = np.cumsum(self.length)
+        #: the start offset of each sentence in the concatenated text
+        self.starts = self.ends - self.length
+        #: the counts computed so far, for each pattern
+        self.counts = dict()
+
+        # the concatenated text, as an array of distinct code points and the index of each character in it
+        codes = np.frombuffer(''.join(sentences).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        self._chars, self._inverse = np.unique(codes, return_inverse=True)
+        self._sentence_starts = np.zeros(len(codes) + 1, dtype=bool)
+        self._sentence_starts[self.starts] = True
+
+    def mask(self, klass):
+        """Return a boolean array telling which characters of the concatenated text match klass."""
+        members = np.fromiter((klass.fullmatch(chr(c)) is not None for c in self._chars.tolist()),
+                              dtype=bool, count=len(self._chars))
+        return members[self._inverse]
+
+    def count(self, pattern, char_class):
+        """Return the number of matches of pattern, parsed into char_class, in each sentence."""
+        counts = self.counts.get(pattern)
+        if counts is None:
+            counts = self.counts[pattern] = self._count(*char_class)
+        return counts
+
+    def _count(self, klass, n, m):
+        mask = self.mask(klass)
+        if n == m == 1:
+            cumsum = np.concatenate(([0], np.cumsum(mask)))
+            return cumsum[self.ends] - cumsum[self.starts]
+
+        # find the runs of characters in the class, a run stopping at the end of a sentence
+        idx = np.flatnonzero(mask)
+        run_starts = np.ones(len(idx), dtype=bool)
+        run_starts[1:] = np.diff(idx) != 1
+        run_starts |= self._sentence_starts[idx]
+        lengths = np.bincount(np.cumsum(run_starts) - 1) if len(idx) else np.zeros(0, dtype=np.int64)
+        # number of greedy matches in a run: one if long enough (unbounded), else as many "full" matches as possible
+        # and one more if what is left is long enough
+        if m is None:
+            matches = lengths >= n
+        else:
+            matches = lengths // m + (lengths % m >= n)
+        sentence = np.searchsorted(self.ends, idx[run_starts], side='right')
+        return np.bincount(sentence, weights=matches, minlength=len(self.sentences)).astype(np.int64)
+
 
 # TODO: a good way to detect encoding errors is to compare the result of
 # len(re.findall('[^\W\d]')) and len(regex.findall('\p{L}'))
@@ -132,13 +323,80 @@ class PatternSentenceFilter(IFilterer):
     You can override this by passing a path to the constructor (``rulespath`` argument).
     """
 
-    def __init__(self, rulespath=None):
-        """Load rules from the default YAML file or the path provided."""
+    #: the number of sentences :py:meth:`filter` checks at once with :py:meth:`filter_batch`
+    chunk_size = 8192
+
+    def __init__(self, rulespath=None, adaptive=False, stats=False, timeout=None, on_timeout='reject', cache=True,
+                 cache_dir=None):
+        """
+        Load rules from the default YAML file or the path provided.
+
+        :param rulespath: the path to the YAML rules
+        :param adaptive: if set, reorder the rules while filtering based on their cost and rejection rate
+        :param stats: if set, collect statistics on each rule (see :py:attr:`stats`). If a number ``n``,
+            only one sentence out of ``n`` is measured
+        :param timeout: if set, the maximum time (in seconds) to count each pattern of a rule on a sentence
+        :param on_timeout: what to do when a rule times out: ``reject`` the sentence, ``accept`` it (the rule passes)
+            or ``skip`` the rule (as if its ``if`` condition failed)
+        :param cache: if set, reuse the rules already loaded from the same file content in the process. Each filterer
+            still has its own ordering, statistics and timeout counts (see :py:meth:`Rules.from_file`)
+        :param cache_dir: if set (with ``cache``), the directory where the rule bundles are cached on disk
+        """
         if rulespath is None:
             rulespath = path.join(path.dirname(path.realpath(__file__)), 'pattern_sentence_filter.yaml')
 
         self.rulespath = rulespath
-        self.rules = Rules(yaml.safe_load(open(rulespath)))
+        self.rules = Rules.from_file(rulespath, adaptive=adaptive, stats=stats, timeout=timeout,
+                                     on_timeout=on_timeout, cache=cache, cache_dir=cache_dir)
+
+    def filter(self, sentences, **kwargs):
+        """
+        Same as :py:meth:`IFilterer.filter`, but lazy (a generator of the valid sentences) and using
+        :py:meth:`filter_batch` on chunks of :py:attr:`chunk_size` sentences when possible, that is if numpy is
+        installed and neither statistics nor adaptive ordering are enabled (they are only updated sentence by sentence).
+        """
+        if np is None or self.rules.stats is not None or self.rules.adaptive:
+            yield from (s for s in sentences if self.is_valid(s, **kwargs))
+            return
+        sentences = iter(sentences)
+        for chunk in iter(lambda: list(itertools.islice(sentences, self.chunk_size)), []):
+            yield from (s for s, valid in zip(chunk, self.filter_batch(chunk)) if valid)
+
+    def filter_batch(self, sentences):
+        """
+        Check a batch of sentences at once (see :py:meth:`Rules.is_valid_batch`). The result is exactly the same
+        as calling :py:meth:`is_valid` on each sentence, but much faster on large batches.
+
+        :param sentences: a list of sentences
+        :return: a numpy boolean array, true for the valid sentences (a list if numpy is not installed)
+        """
+        if np is None:
+            print('WARNING: pattern_sentence_filter.py, filter_batch requires the numpy package: pip install numpy.')
+            return [self.is_valid(s) for s in sentences]
+        return self.rules.is_valid_batch(sentences)
+
+    def features(self, sentences):
+        """
+        Compute the metrics checked by the rules on a batch of sentences (see :py:meth:`Rules.features`),
+        e.g. to train or threshold a model downstream. Requires numpy.
+
+        :param sentences: a list of sentences
+        :return: a numpy float matrix, with one row per sentence and one column per rule metric
+            (see :py:attr:`feature_names`)
+        """
+        if np is None:
+            raise ImportError('pattern_sentence_filter.py, features requires the numpy package: pip install numpy.')
+        return self.rules.features(sentences)
+
+    @property
+    def feature_names(self):
+        """The name of each column of :py:meth:`features`, ``<rule id>.<metric>``."""
+        return self.rules.feature_names
+
+    @property
+    def stats(self):
+        """The :py:class:`RuleStats` collected so far, or None if stats are disabled."""
+        return self.rules.stats
 
     def is_valid(self, sentence):
         """Returns true only if all the rules were respected."""
@@ -152,26 +410,73 @@ class MinMax:
         self.min = min
         self.max = max
 
-    def is_invalid(self, s) -> bool:
+    def is_invalid(self, s, features=None) -> bool:
         return self.is_out_of_range(len(s))
 
+    def patterns(self):
+        return []
+
+    def is_invalid_batch(self, features, char_classes=None):
+        return self.are_out_of_range(features.length)
+
+    def metrics(self):
+        return ['length']
+
+    def measure(self, s, features=None):
+        return [len(s)]
+
+    def measure_batch(self, features, char_classes=None):
+        return [features.length]
+
     def is_out_of_range(self, n) -> bool:
         return (self.min >= 0 and self.min > n) or (self.max >= 0 and self.max < n)
 
+    def are_out_of_range(self, values):
+        """Same as :py:meth:`is_out_of_range`, but on a numpy array of values."""
+        out = np.zeros(len(values), dtype=bool)
+        if self.min >= 0:
+            out |= values < self.min
+        if self.max >= 0:
+            out |= values > self.max
+        return out
+
     def __repr__(self):
         return "(min={}, max={})".format(self.min, self.max)
 
 
 class Compare:
-    def __init__(self, num, denom, ratio):
-        self.num = regex.compile(num)
-        self.denom = regex.compile(denom)
+    def __init__(self, num, denom, ratio, engine='re'):
+        self.num = compile_pattern(num, engine=engine)
+        self.denom = compile_pattern(denom, engine=engine)
         self.ratio = MinMax(**ratio)
 
-    def is_invalid(self, s):
-        ratio = len(self.num.findall(s)) / (len(self.denom.findall(s)) + 1)
+    def is_invalid(self, s, features=None):
+        if features is None:
+            features = SentenceFeatures(s)
+        ratio = features.count(self.num) / (features.count(self.denom) + 1)
         return self.ratio.is_out_of_range(ratio)
 
+    def is_invalid_batch(self, features, char_classes):
+        num = features.count(self.num, char_classes[self.num])
+        denom = features.count(self.denom, char_classes[self.denom])
+        return self.ratio.are_out_of_range(num / (denom + 1))
+
+    def metrics(self):
+        return ['ratio']
+
+    def measure(self, s, features=None):
+        if features is None:
+            features = SentenceFeatures(s)
+        return [features.count(self.num) / (features.count(self.denom) + 1)]
+
+    def measure_batch(self, features, char_classes):
+        num = features.count(self.num, char_classes[self.num])
+        denom = features.count(self.denom, char_classes[self.denom])
+        return [num / (denom + 1)]
+
+    def patterns(self):
+        return [self.num, self.denom]
+
     def __repr__(self):
         return "Compare(num=%s, denom=%s, ratio=%s)" % (self.num, self.denom, self.ratio)
 
@@ -179,23 +484,59 @@ class Compare:
 class Find:
     """Handles pattern-based rule logic (find entry in yaml)"""
 
-    def __init__(self, pattern, count=None, ratio=None):
+    def __init__(self, pattern, count=None, ratio=None, engine='re'):
         if count is None and ratio is None:
             logger.warning(f"{pattern}: missing find condition: count or ratio...")
-        self.pattern = regex.compile(pattern)
+        self.pattern = compile_pattern(pattern, engine=engine)
         self.count = MinMax(**count) if count else None
         self.ratio = MinMax(**ratio) if ratio else None
-
-    def is_invalid(self, s):
-        matches = self.pattern.findall(s)
-        nb_matches = len(matches)
+        #: the number of matches after which the result is known (None if all the matches must be counted)
+        self.limit = None
+        if self.count and not self.ratio:
+            if self.count.max >= 0:
+                self.limit = self.count.max + 1
+            elif self.count.min >= 0:
+                self.limit = self.count.min
+
+    def is_invalid(self, s, features=None):
+        if features is None:
+            features = SentenceFeatures(s)
+        nb_matches = features.count(self.pattern, self.limit)
         if self.count and self.count.is_out_of_range(nb_matches):
             return True
         if self.ratio:
-            ratio = nb_matches / len(s)
+            ratio = nb_matches / len(s) if s else 0
             return self.ratio.is_out_of_range(ratio)
         return False
 
+    def is_invalid_batch(self, features, char_classes):
+        nb_matches = features.count(self.pattern, char_classes[self.pattern])
+        invalid = np.zeros(len(nb_matches), dtype=bool)
+        if self.count:
+            invalid |= self.count.are_out_of_range(nb_matches)
+        if self.ratio:
+            ratio = np.divide(nb_matches, features.length, out=np.zeros(len(nb_matches)), where=features.length > 0)
+            invalid |= self.ratio.are_out_of_range(ratio)
+        return invalid
+
+    def metrics(self):
+        return ['count'] * bool(self.count) + ['ratio'] * bool(self.ratio)
+
+    def measure(self, s, features=None):
+        # unlike is_invalid, all the matches are counted: features must not be shared with is_invalid
+        if features is None:
+            features = SentenceFeatures(s)
+        nb_matches = features.count(self.pattern)
+        return [nb_matches] * bool(self.count) + [nb_matches / len(s) if s else 0] * bool(self.ratio)
+
+    def measure_batch(self, features, char_classes):
+        nb_matches = features.count(self.pattern, char_classes[self.pattern])
+        ratio = np.divide(nb_matches, features.length, out=np.zeros(len(nb_matches)), where=features.length > 0)
+        return [nb_matches] * bool(self.count) + [ratio] * bool(self.ratio)
+
+    def patterns(self):
+        return [self.pattern]
+
     def __repr__(self):
         return "Find(pattern=%s, count=%s, ratio=%s)" % (self.pattern, self.count, self.ratio)
 
@@ -203,35 +544,51 @@ class Find:
 class Rule:
     """Encapsulates one rule"""
 
-    def __init__(self, id, descr, find=None, compare=None, length=None, examples=None, counterexamples=None, **kwargs):
+    def __init__(self, id, descr, find=None, compare=None, length=None, examples=None, counterexamples=None,
+                 timeout=None, **kwargs):
         self.id = id
         self.descr = descr
         self.examples = examples
         self.counterexamples = counterexamples
+        #: the maximum time to count each pattern of the rule on a sentence, in seconds
+        self.timeout = timeout
+        #: identifies what the rule checks (its condition, logic and timeout, but not its description or examples)
+        self.fingerprint = hashlib.sha1(json.dumps([kwargs.get('if'), find, compare, length, timeout],
+                                                   sort_keys=True, default=str).encode()).hexdigest()
+        # only regex supports timeouts
+        engine = 're' if timeout is None else 'regex'
         self.iff = []
         # TODO: better way ?
         if 'if' in kwargs:  # if is a reserved keyword in python
+            # length conditions first: they are cheaper
             if 'length' in kwargs['if']:
                 self.iff.append(MinMax(**kwargs['if']['length']))
             if 'pattern' in kwargs['if']:
-                self.iff.append(Find(**kwargs['if']['pattern']))
+                self.iff.append(Find(engine=engine, **kwargs['if']['pattern']))
 
         if length is not None:
             self.logic = MinMax(**length) if length else None
         elif find is not None:
-            self.logic = Find(**find)
+            self.logic = Find(engine=engine, **find)
         elif compare is not None:
-            self.logic = Compare(**compare)
+            self.logic = Compare(engine=engine, **compare)
         else:
             raise Exception('Found a rule with no length, find or ratio defined.')
 
-    def is_applicable(self, s) -> bool:
+    def is_applicable(self, s, features=None) -> bool:
         """Check for the if condition"""
-        return not any([iff.is_invalid(s) for iff in self.iff])
-
-    def is_invalid(self, s) -> bool:
-        if self.is_applicable(s):
-            if self.logic.is_invalid(s):
+        if features is None:
+            features = SentenceFeatures(s)
+        for iff in self.iff:
+            if iff.is_invalid(s, features):
+                return False
+        return True
+
+    def is_invalid(self, s, features=None) -> bool:
+        if features is None:
+            features = SentenceFeatures(s)
+        if not self.iff or self.is_applicable(s, features):
+            if self.logic.is_invalid(s, features):
                 logger.debug("%s FAILED on |%s|" % (self, s))
                 return True
             return False
@@ -239,8 +596,32 @@ class Rule:
             # logger.debug("SKIPPED   RULE %s: |%s|" % (self.descr, s))
             return False
 
+    def is_invalid_batch(self, features, char_classes):
+        """
+        Same as :py:meth:`is_invalid`, but on a whole batch of sentences at once.
+        All the patterns of the rule must be in char_classes (see :py:func:`parse_char_class`).
+
+        :return: a numpy boolean array, true for the invalid sentences
+        """
+        invalid = self.logic.is_invalid_batch(features, char_classes)
+        for iff in self.iff:
+            invalid &= ~iff.is_invalid_batch(features, char_classes)
+        return invalid
+
+    def patterns(self):
+        """Return the compiled patterns used by this rule, including its if conditions."""
+        return [p for logic in self.iff + [self.logic] for p in logic.patterns()]
+
+    def lint(self):
+        """Return warnings about the patterns of the rule that may backtrack catastrophically (nested quantifiers)."""
+        return [f'nested quantifiers in {", ".join(groups)} may backtrack catastrophically'
+                for groups in (nested_quantifiers(p.pattern) for p in dict.fromkeys(self.patterns())) if groups]
+
     def self_check(self, verbose=True) -> bool:
         passed = True
+        for warning in self.lint():
+            if verbose: print(f' Warning: {warning}.')
+            passed = False
         for examples, expected in [(self.examples, True), (self.counterexamples, False)]:
             if examples is not None:
                 if verbose: print(f' Checking {len(examples)} {str(expected):5s} examples...', end=' ', flush=True)
@@ -262,22 +643,325 @@ class Rule:
 class Rules:
     """
     This class represents a list of rules.
+
+    Rules are compiled into a plan: each distinct pattern is only counted once per sentence, no matter how many rules
+    or ``if`` conditions use it, and counting stops as soon as the result is known (e.g. after the first match for
+    ``max: 0``). Since rules are *AND-based*, the order of evaluation doesn't change the result, so it can be
+    optimized (see :py:meth:`reorder`).
+
+    A badly written pattern can take ages (exponential time) on some sentences. With a ``timeout``, counting a pattern
+    of a rule is aborted after ``timeout`` seconds and the rule rejects the sentence, accepts it or is skipped,
+    depending on ``on_timeout``. Patterns with nested quantifiers, the most common cause of catastrophic
+    backtracking, are reported as warnings (see :py:meth:`Rule.lint`).
     """
 
-    def __init__(self, rules_dict):
+    #: with adaptive ordering, measure the rules on one sentence out of ``sample_every``
+    sample_every = 10
+    #: with adaptive ordering, how many sentences to measure before reordering the rules
+    reorder_every = 100
+    #: with adaptive ordering, the weight of the past measures at each reordering
+    decay = 0.8
+    #: what to do when a rule times out
+    timeout_policies = ('reject', 'accept', 'skip')
+    #: the version of the rule bundles format, see :py:meth:`from_file`
+    bundle_version = 2
+    # the rules of the last files loaded, by bundle key and options, copied by from_file (see _copy)
+    _shared = LRUCache(max_entries=8)
+
+    def __init__(self, rules_dict, adaptive=False, stats=False, timeout=None, on_timeout='reject'):
         """
         :param rules_dict: a dictionary of rules (as loaded by yaml)
+        :param adaptive: if set, measure the cost and rejection rate of each rule while filtering and
+            reorder them regularly (see :py:meth:`reorder`)
+        :param stats: if set, evaluate all the rules on every sentence and collect statistics in :py:attr:`stats`.
+            If a number ``n``, only one sentence out of ``n`` is measured
+        :param timeout: the default timeout of the rules (see :py:attr:`Rule.timeout`), in seconds
+        :param on_timeout: what to do when a rule times out, one of :py:attr:`timeout_policies`: ``reject`` the
+            sentence, ``accept`` it (the rule passes) or ``skip`` the rule (as if its ``if`` condition failed)
+        """
+        if on_timeout not in self.timeout_policies:
+            raise ValueError(f'Unknown timeout policy {on_timeout}. Valid policies are: '
+                             f'{", ".join(self.timeout_policies)}.')
+        self.on_timeout = on_timeout
+        self.rules = [Rule(idx + 1, **dict(dict(timeout=timeout), **r)) for (idx, r) in enumerate(rules_dict)]
+        for r in self.rules:
+            for warning in r.lint():
+                logger.warning('%s: %s', r, warning)
+        #: the distinct patterns used by the rules: each one is counted at most once per sentence
+        self.patterns = list(dict.fromkeys(p for r in self.rules for p in r.patterns()))
+        #: the patterns matching runs of a single character class, that can be counted on whole batches
+        self.char_classes = {p: cc for p, cc in ((p, parse_char_class(p.pattern)) for p in self.patterns) if cc}
+        #: the name of each column of :py:meth:`features`: ``<rule id>.<metric>``, metric being ``length``,
+        #: ``count`` or ``ratio``
+        self.feature_names = [f'{r.id}.{metric}' for r in self.rules for metric in r.logic.metrics()]
+
+        # a pattern is counted once for all the rules using it: use the highest limit, if all of them have one
+        limits = dict()
+        for logic in self._logics():
+            limit = logic.limit if isinstance(logic, Find) else None
+            for p in logic.patterns():
+                if limit is None or limits.get(p, limit) is None:
+                    limits[p] = None
+                else:
+                    limits[p] = max(limit, limits.get(p, limit))
+        for logic in self._logics():
+            if isinstance(logic, Find):
+                logic.limit = limits[logic.pattern]
+
+        #: the timeout of the patterns of rules with a timeout: the highest one, if all the rules using it have one.
+        #: Patterns of a single character class run in linear time and are never given a timeout (it has a cost)
+        self.pattern_timeouts = dict()
+        users = dict()
+        for r in self.rules:
+            for p in dict.fromkeys(r.patterns()):
+                users.setdefault(p, []).append(r.timeout)
+        for p, timeouts in users.items():
+            if p not in self.char_classes and all(t is not None for t in timeouts):
+                self.pattern_timeouts[p] = max(timeouts)
+
+        self._init_state(adaptive, stats)
+
+    def _init_state(self, adaptive, stats):
+        # the state updated while filtering: everything else never changes once constructed
+        #: the rules in evaluation order: length-based rules first, then the rules needing regex work
+        self.plan = sorted(self.rules, key=lambda r: len(r.patterns()) > 0)
+        self.adaptive = adaptive
+        #: for each rule (by id), the (decayed) time spent evaluating it and the number of sentences it rejected
+        self.costs = {r.id: 0.0 for r in self.rules}
+        self.rejections = {r.id: 0.0 for r in self.rules}
+        #: for each rule (by id), the number of sentences on which it timed out
+        self.timeouts = {r.id: 0 for r in self.rules}
+        #: the statistics on each rule, if enabled
+        self.stats = RuleStats(self.rules) if stats else None
+        self.stats_every = int(stats)
+        self._seen = 0  # the number of sentences filtered, for sampling
+        self._pending = 0  # the number of sentences measured since the last reordering
+
+    @classmethod
+    def from_file(cls, rulespath, adaptive=False, stats=False, timeout=None, on_timeout='reject',
+                  cache=True, cache_dir=None) -> 'Rules':
+        """
+        Load rules from a YAML file. With ``cache``:
+
+        * the rules of the last few files loaded are kept in memory: loading the same content with the same
+          ``timeout`` and ``on_timeout`` returns a copy sharing the rules and their patterns, which never change.
+          The ordering, measures, statistics and :py:attr:`timeouts` are specific to each copy;
+        * if ``cache_dir`` is set, the parsed rules and how each pattern was compiled
+          (see :py:func:`~phrasal.regex_utils.dump_compiled`) are stored in a bundle in this directory
+          (``<cache_dir>/<sha256>.json``), keyed by the hash of the content, so they are not parsed nor translated
+          again as long as the file doesn't change. Nothing is written to disk otherwise.
+
+        The other parameters are passed to the constructor.
         """
-        self.rules = [Rule(idx + 1, **r) for (idx, r) in enumerate(rules_dict)]  # [:1]
+        with open(rulespath, 'rb') as f:
+            data = f.read()
+        if not cache:
+            return cls(_parse_yaml(data), adaptive=adaptive, stats=stats, timeout=timeout, on_timeout=on_timeout)
+
+        key = hashlib.sha256(data)
+        key.update(f'|{cls.bundle_version}|{regex.__version__}|{sys.version_info[:2]}'.encode())
+        key = key.hexdigest()
+        shared = cls._shared.get((key, timeout, on_timeout))
+        if shared is not None:
+            return shared._copy(adaptive, stats)
+
+        bundlepath = path.join(cache_dir, key + '.json') if cache_dir is not None else None
+        bundle = _read_bundle(bundlepath, key) if bundlepath is not None else None
+        if bundle is None:
+            bundle = dict(key=key, rules=_parse_yaml(data), patterns=[])
+        load_compiled(bundle['patterns'])
+        rules = cls(bundle['rules'], timeout=timeout, on_timeout=on_timeout)
+
+        # new patterns (e.g. compiled with another engine because of a timeout) are added to the bundle
+        missing = [entry for entry in dump_compiled(rules.patterns) if entry not in bundle['patterns']]
+        if missing and bundlepath is not None:
+            bundle['patterns'] += missing
+            _write_bundle(bundlepath, bundle)
+        cls._shared.put((key, timeout, on_timeout), rules)
+        return rules._copy(adaptive, stats)
+
+    def _copy(self, adaptive, stats) -> 'Rules':
+        # a copy sharing the rules (and everything derived from them), with its own state
+        rules = copy.copy(self)
+        rules._init_state(adaptive, stats)
+        return rules
+
+    def _logics(self):
+        return [logic for r in self.rules for logic in r.iff + [r.logic]]
 
     def is_invalid(self, sentence: str) -> bool:
         """Returns true if any rule that apply failed."""
-        for idx, r in enumerate(self.rules):
-            if r.is_invalid(sentence):
-                # print("RULE %d %s FAILED on |%s|" % (idx, r.descr, sentence))
-                return True
+        if self.stats is not None or self.adaptive:
+            self._seen += 1
+            if self.stats is not None and self._seen % self.stats_every == 0:
+                return self._is_invalid_measured(sentence, early_exit=False)
+            if self.adaptive and self._seen % self.sample_every == 0:
+                return self._is_invalid_measured(sentence)
+        features = SentenceFeatures(sentence, self.pattern_timeouts)
+        for idx, r in enumerate(self.plan):
+            try:
+                if r.is_invalid(sentence, features):
+                    # print("RULE %d %s FAILED on |%s|" % (idx, r.descr, sentence))
+                    return True
+            except TimeoutError:
+                if self._timed_out(r, sentence):
+                    return True
         return False
 
+    def _timed_out(self, rule, sentence) -> bool:
+        # count the timeout and apply the policy: return true if the rule rejects the sentence
+        self.timeouts[rule.id] += 1
+        logger.warning("%s TIMED OUT on |%s|" % (rule, sentence[:100]))
+        return self.on_timeout == 'reject'
+
+    def _is_invalid_measured(self, sentence: str, early_exit=True) -> bool:
+        # same as is_invalid, but measuring the time spent and the rejections of each rule
+        features = SentenceFeatures(sentence, self.pattern_timeouts)
+        invalid = False
+        for r in self.plan:
+            start = time.perf_counter()
+            timed_out = False
+            try:
+                skipped = bool(r.iff) and not r.is_applicable(sentence, features)
+                rejected = not skipped and r.logic.is_invalid(sentence, features)
+            except TimeoutError:
+                timed_out = True
+                rejected = self._timed_out(r, sentence)
+                skipped = self.on_timeout == 'skip'
+            elapsed = time.perf_counter() - start
+            self.costs[r.id] += elapsed
+            if self.stats is not None:
+                self.stats.add(r.id, elapsed, skipped, rejected, first=rejected and not invalid, timed_out=timed_out)
+            if rejected:
+                logger.debug("%s FAILED on |%s|" % (r, sentence))
+                self.rejections[r.id] += 1
+                invalid = True
+                if early_exit:
+                    break
+
+        if self.stats is not None:
+            self.stats.sentences += 1
+            self.stats.rejected += invalid
+
+        if self.adaptive:
+            self._pending += 1
+            if self._pending >= self.reorder_every:
+                self.reorder()
+        return invalid
+
+    def reorder(self):
+        """
+        Reorder the rules based on the measures so far, so that the rules rejecting the most sentences per unit
+        of time are checked first. Rules that never rejected anything are checked last, the cheapest first.
+        The measures are then decayed, so that the ordering can follow changes in the input.
+        """
+        def key(r):
+            cost, rejections = self.costs[r.id], self.rejections[r.id]
+            if rejections == 0:
+                return 1, cost
+            return 0, -rejections / max(cost, 1e-9)
+
+        self.plan = sorted(self.plan, key=key)
+        for r in self.rules:
+            self.costs[r.id] *= self.decay
+            self.rejections[r.id] *= self.decay
+        self._pending = 0
+
+    def optimize(self, sentences):
+        """
+        Measure the cost and the rejection rate of every rule on a sample of sentences, and reorder the rules
+        accordingly (see :py:meth:`reorder`). Each rule is evaluated on every sentence.
+
+        :param sentences: a (representative) sample of sentences
+        """
+        adaptive, self.adaptive = self.adaptive, False
+        stats, self.stats = self.stats, None
+        for r in self.rules:
+            self.costs[r.id] = self.rejections[r.id] = 0.0
+        for sentence in sentences:
+            self._is_invalid_measured(sentence, early_exit=False)
+        self.reorder()
+        self.adaptive, self.stats = adaptive, stats
+
+    def is_valid_batch(self, sentences):
+        """
+        Check a batch of sentences at once (requires numpy). Rules using only length bounds and patterns matching
+        runs of a single character class (see :py:attr:`char_classes`) are evaluated on the whole batch using numpy
+        arrays, then the others are checked one sentence at a time on the sentences still valid.
+        Adaptive ordering and statistics are not updated.
+
+        :param sentences: a list of sentences
+        :return: a numpy boolean array, true for the valid sentences
+        """
+        features = BatchFeatures(sentences)
+        valid = np.ones(len(sentences), dtype=bool)
+        others = []
+        for r in self.plan:
+            if all(p in self.char_classes for p in r.patterns()):
+                valid &= ~r.is_invalid_batch(features, self.char_classes)
+            else:
+                others.append(r)
+
+        for idx in np.flatnonzero(valid).tolist():
+            sentence = sentences[idx]
+            sentence_features = SentenceFeatures(sentence, self.pattern_timeouts)
+            for r in others:
+                if self.rejects(r, sentence, sentence_features):
+                    valid[idx] = False
+                    break
+        return valid
+
+    def features(self, sentences):
+        """
+        Compute the metrics checked by the rules on a batch of sentences (requires numpy): the length for
+        length-based rules, the number of matches and/or the ratio for ``find`` rules, the ratio for ``compare``
+        rules. Each value is the one compared to the rule's bounds, but the ``if`` conditions are ignored and all the
+        matches are counted. As when filtering, each distinct pattern is counted once per sentence, on the whole
+        batch at once if it matches runs of a single character class (see :py:attr:`char_classes`).
+        The value of a metric is NaN if counting timed out (see :py:attr:`pattern_timeouts`).
+
+        :param sentences: a list of sentences
+        :return: a numpy float matrix, with one row per sentence and one column per rule metric
+            (see :py:attr:`feature_names`)
+        """
+        matrix = np.zeros((len(sentences), len(self.feature_names)))
+        batch, others = [], []
+        start = 0
+        for r in self.rules:
+            columns = slice(start, start + len(r.logic.metrics()))
+            start = columns.stop
+            if columns.stop > columns.start:
+                (batch if all(p in self.char_classes for p in r.logic.patterns()) else others).append((r, columns))
+
+        if batch:
+            features = BatchFeatures(sentences)
+            for r, columns in batch:
+                matrix[:, columns] = np.column_stack(r.logic.measure_batch(features, self.char_classes))
+        if others:
+            for idx, sentence in enumerate(sentences):
+                features = SentenceFeatures(sentence, self.pattern_timeouts)
+                for r, columns in others:
+                    try:
+                        matrix[idx, columns] = r.logic.measure(sentence, features)
+                    except TimeoutError:
+                        self._timed_out(r, sentence)
+                        matrix[idx, columns] = np.nan
+        return matrix
+
+    def rejects(self, rule, sentence, features) -> bool:
+        """
+        Check a single rule (see :py:meth:`Rule.is_invalid`), applying the timeout policy if it times out.
+
+        :param rule: one of the rules
+        :param sentence: the sentence
+        :param features: the features of the sentence, created with the :py:attr:`pattern_timeouts`
+        :return: true if the rule rejects the sentence
+        """
+        try:
+            return rule.is_invalid(sentence, features)
+        except TimeoutError:
+            return self._timed_out(rule, sentence)
+
     def print_rules(self):
         """Prints all the rules, useful for debug."""
         for idx, r in enumerate(self.rules):
@@ -290,6 +974,123 @@ class Rules:
         return len(self.rules)
 
 
+def _parse_yaml(data):
+    # the C loader (libyaml) is much faster, if available
+    return yaml.load(data, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def _read_bundle(bundlepath, key):
+    # return the bundle, or None if it doesn't exist or is outdated
+    try:
+        with open(bundlepath, encoding='utf-8') as f:
+            bundle = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return bundle if isinstance(bundle, dict) and bundle.get('key') == key else None
+
+
+def _write_bundle(bundlepath, bundle):
+    # write to a temporary file first, so that concurrent processes never read a partial bundle
+    tmppath = f'{bundlepath}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(path.dirname(bundlepath), exist_ok=True)
+        with open(tmppath, 'w', encoding='utf-8') as f:
+            json.dump(bundle, f, ensure_ascii=False)
+        os.replace(tmppath, bundlepath)
+    except (OSError, TypeError, ValueError) as e:  # e.g. read-only directory or rules not serializable
+        logger.debug(f'could not write the rule bundle {bundlepath}: {e}')
+        if path.exists(tmppath):
+            os.remove(tmppath)
+
+
+class RuleStats:
+    """
+    Statistics on the rules of a :py:class:`Rules`, collected while filtering. For each rule (by id), it counts:
+
+    * ``evaluations``: the number of sentences the rule was evaluated on;
+    * ``skips``: the number of sentences the rule didn't apply to (``if`` condition);
+    * ``rejections``: the number of sentences the rule rejected;
+    * ``first_rejections``: the number of sentences the rule rejected first (in evaluation order), i.e. the
+      sentences that would have been accepted without the rules evaluated before;
+    * ``timeouts``: the number of sentences on which the rule timed out (these are also counted as skips or
+      rejections, depending on the timeout policy);
+    * ``time``: the time spent evaluating the rule, in seconds.
+
+    Stats collected in different processes can be merged (see :py:meth:`merge`) and exported as JSON.
+    """
+
+    counters = ('evaluations', 'skips', 'rejections', 'first_rejections', 'timeouts', 'time')
+
+    def __init__(self, rules=()):
+        """
+        :param rules: the rules to collect statistics on
+        """
+        #: the number of sentences filtered
+        self.sentences = 0
+        #: the number of sentences rejected
+        self.rejected = 0
+        #: for each rule id, its description and counters
+        self.rules = {r.id: dict(descr=r.descr, **{c: 0 for c in self.counters}) for r in rules}
+
+    def add(self, rule_id, elapsed, skipped, rejected, first=False, timed_out=False):
+        """Record the evaluation of a rule on one sentence."""
+        stats = self.rules[rule_id]
+        stats['evaluations'] += 1
+        stats['time'] += elapsed
+        if timed_out:
+            stats['timeouts'] += 1
+        if skipped:
+            stats['skips'] += 1
+        elif rejected:
+            stats['rejections'] += 1
+            if first:
+                stats['first_rejections'] += 1
+
+    def merge(self, other: 'RuleStats') -> 'RuleStats':
+        """Add the counters of other (e.g. collected by another process) to this one. Returns self."""
+        self.sentences += other.sentences
+        self.rejected += other.rejected
+        for rule_id, stats in other.rules.items():
+            if rule_id not in self.rules:
+                self.rules[rule_id] = dict(descr=stats['descr'], **{c: 0 for c in self.counters})
+            for c in self.counters:
+                self.rules[rule_id][c] += stats[c]
+        return self
+
+    def clear(self):
+        """Reset all the counters."""
+        self.sentences = self.rejected = 0
+        for stats in self.rules.values():
+            stats.update({c: 0 for c in self.counters})
+
+    def to_dict(self) -> dict:
+        """Get the statistics as a (JSON-serializable) dictionary."""
+        return dict(sentences=self.sentences, rejected=self.rejected,
+                    rules=[dict(id=rule_id, **stats) for rule_id, stats in self.rules.items()])
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'RuleStats':
+        """Load statistics exported using :py:meth:`to_dict`."""
+        stats = cls()
+        stats.sentences, stats.rejected = d['sentences'], d['rejected']
+        # counters missing from older exports are set to 0
+        stats.rules = {r['id']: dict({c: 0 for c in cls.counters}, **{k: v for k, v in r.items() if k != 'id'})
+                       for r in d['rules']}
+        return stats
+
+    def to_json(self, **kwargs) -> str:
+        """Export the statistics as JSON. The kwargs are passed to :py:func:`json.dumps`."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+    @classmethod
+    def from_json(cls, s: str) -> 'RuleStats':
+        """Load statistics exported using :py:meth:`to_json`."""
+        return cls.from_dict(json.loads(s))
+
+    def __repr__(self):
+        return "RuleStats(sentences=%d, rejected=%d)" % (self.sentences, self.rejected)
+
+
 def main():
     import argparse
     import sys
@@ -298,13 +1099,30 @@ def main():
     parser.add_argument('-i', '--input', type=argparse.FileType('r'), default='-')
     parser.add_argument('-o', '--out', type=argparse.FileType('w'), default='-')
     parser.add_argument('-r', '--rules-file', default=None)
+    parser.add_argument('-a', '--adaptive', default=False, action='store_true',
+                        help='reorder the rules while filtering, based on their cost and rejection rate')
+    parser.add_argument('-s', '--stats', type=argparse.FileType('w'), default=None,
+                        help='collect statistics on each rule and write them (JSON) to this file')
+    parser.add_argument('--stats-every', type=int, default=1,
+                        help='with --stats, only measure one sentence out of STATS_EVERY')
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help='maximum time (in seconds) to count each pattern of a rule on a sentence')
+    parser.add_argument('--on-timeout', choices=Rules.timeout_policies, default='reject',
+                        help='what to do when a rule times out (default: reject the sentence)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='cache the parsed and compiled rules in this directory, for a faster startup')
 
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(levelname)s: %(msg)s')
 
-    psf = PatternSentenceFilter(rulespath=args.rules_file)
+    psf = PatternSentenceFilter(rulespath=args.rules_file, adaptive=args.adaptive,
+                                stats=args.stats_every if args.stats is not None else False,
+                                timeout=args.timeout, on_timeout=args.on_timeout, cache_dir=args.cache_dir)
 
     args.out.write('\n'.join(
         t for t in args.input if psf.is_valid(t)
     ))
+
+    if args.stats is not None:
+        args.stats.write(psf.stats.to_json(indent=2))
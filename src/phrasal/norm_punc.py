@@ -11,12 +11,25 @@
 # Lucy Linder, June 2019
 #
 
-__all__ = ['Normalizer', 'normalize_text']
+__all__ = ['Normalizer', 'normalize_text', 'normalize_stream', 'make_normalizer']
 
 import argparse
+import functools
+import itertools
+import os
+import json
 import re
 import sys
+import time
 import unicodedata
+from collections import OrderedDict, defaultdict, namedtuple
+
+from .utils import LRUCache, in_worker, worker_pool
+
+try:
+    import re._parser as sre_parse  # python >= 3.11
+except ImportError:
+    import sre_parse
 
 REG, STR = 0, 1  # flags for using re.sub vs string.replace
 
@@ -25,77 +38,82 @@ wrong_encoding_pattern = re.compile(r'\u0007|\u007F|\u0080-\u00A0|\u00C2|\u00C3|
 # misc symbols + http://stackoverflow.com/a/13752628/6762004
 emoji_pattern = re.compile('[\u2300-\u23ff\u2b50-\u2b55\u2600-\u2800\U00010000-\U0010FFFF]', re.UNICODE)
 
+# non-breakable space + https://www.compart.com/en/unicode/category/Zs (except the regular space)
+_spaces = '\u00A0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200A\u202F\u205F\u3000'
 spaces_pattern = re.compile(
-    # non-breakable space + https://www.compart.com/en/unicode/category/Zs
-    '[\u00A0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200A\u202F\u205F\u3000 ]+',
+    # any run of spaces, except a lone regular space: replacing it with itself is a no-op,
+    # but would cost one substitution per word
+    f' [{_spaces} ]+|[{_spaces}][{_spaces} ]*',
     flags=re.UNICODE
 )
 
-normalization_patterns = [
-    (t, r if t == STR else re.compile(r), s) for (t, r, s) in
+#: the normalization rules, as ``(REG|STR, pattern, replace, group)`` tuples. Groups can be selected in
+#: :py:class:`Normalizer`, see :py:data:`normalization_groups`
+normalization_rules = [
+    (t, r if t == STR else re.compile(r), s, g) for (t, r, s, g) in
     [  # largely inspired from Moses normalize-punctuation.perl (lang=de)
         # strip control chars and \t, \r, but not \n (0x0A) + \u200d (zero-width joiner)
-        (REG, u'[\x00-\x09\x0B-\x1F\x7F-\x9F\u200d]', ' '),
+        (REG, u'[\x00-\x09\x0B-\x1F\x7F-\x9F\u200d]', ' ', 'control'),
         # strip soft-hyphen (and don't replace it by space: http://jkorpela.fi/shy.html)
-        (STR, '\u00AD', ''),
+        (STR, '\u00AD', '', 'control'),
         # strip extra combining diacritics (given unicodedata.normalize was run prior to this)
-        (REG, '[\u0300-\u036F\uFE00-\uFE0F]', ''),
+        (REG, '[\u0300-\u036F\uFE00-\uFE0F]', '', 'control'),
         # replace variation selectors (0xFE0F is often used, sometimes in a row...)
-        (REG, '[\u0300-\u036F\uFE00-\uFE0F]', ' '),
+        (REG, '[\u0300-\u036F\uFE00-\uFE0F]', ' ', 'control'),
         # strip the � character, except when it might help detect a wrong encoding issue (shouldn't happen if ftfy is installed)
-        (REG, r'([^\u0084]?)\uFFFD+', r'\1'),
+        (REG, r'([^\u0084]?)\uFFFD+', r'\1', 'control'),
         # normalize unicode punctuation
-        (STR, '`', "'"),
-        (STR, '„', '"'),
-        (STR, '“', '"'),
-        (STR, '”', '"'),
-        (STR, '—', ' - '),
-        (REG, u'[\u00AF\u2010-\u2015\u2212\uFE58\uFE63\uFF0D\u1806]', '-'),  # dashes
-        (STR, '´', "'"),
-        (REG, r'([^\W\d_])[‘’]([^\W\d_])', r"\1'\2"),  # I
-        (STR, '‘', '"'),
-        (STR, '’', '"'),
-        (STR, '‛', '"'),
-        (STR, u'\u0092', "'"),
-        (STR, u'\u0093', '"'),
-        (STR, '‚', '"'),
-        (STR, "''", '"'),
-        (STR, '…', '...'),
+        (STR, '`', "'", 'quotes'),
+        (STR, '„', '"', 'quotes'),
+        (STR, '“', '"', 'quotes'),
+        (STR, '”', '"', 'quotes'),
+        (STR, '—', ' - ', 'dashes'),
+        (REG, u'[\u00AF\u2010-\u2015\u2212\uFE58\uFE63\uFF0D\u1806]', '-', 'dashes'),  # dashes
+        (STR, '´', "'", 'quotes'),
+        (REG, r'([^\W\d_])[‘’]([^\W\d_])', r"\1'\2", 'quotes'),  # I
+        (STR, '‘', '"', 'quotes'),
+        (STR, '’', '"', 'quotes'),
+        (STR, '‛', '"', 'quotes'),
+        (STR, u'\u0092', "'", 'quotes'),
+        (STR, u'\u0093', '"', 'quotes'),
+        (STR, '‚', '"', 'quotes'),
+        (STR, "''", '"', 'quotes'),
+        (STR, '…', '...', 'punctuation'),
         # French quotes
-        (STR, '\u00A0«\u00A0', ' "'),
-        (STR, '«\u00A0', '"'),
-        (STR, '«', '"'),
-        (STR, '\u00A0»\u00A0', '" '),
-        (STR, '\u00A0»', '"'),
-        (STR, '»', '"'),
+        (STR, '\u00A0«\u00A0', ' "', 'quotes'),
+        (STR, '«\u00A0', '"', 'quotes'),
+        (STR, '«', '"', 'quotes'),
+        (STR, '\u00A0»\u00A0', '" ', 'quotes'),
+        (STR, '\u00A0»', '"', 'quotes'),
+        (STR, '»', '"', 'quotes'),
         # other symbols
-        (STR, '‹', '<'),
-        (STR, '›', '>'),
+        (STR, '‹', '<', 'quotes'),
+        (STR, '›', '>', 'quotes'),
         # ligatures
-        (STR, 'œ', 'oe'),
-        (STR, 'æ', 'ae'),
-        (STR, 'ﬁ', 'fi'),
-        (STR, 'ﬀ', 'ff'),
-        (STR, 'ﬂ', 'fl'),
-        (STR, 'ĳ', 'ij'),
+        (STR, 'œ', 'oe', 'ligatures'),
+        (STR, 'æ', 'ae', 'ligatures'),
+        (STR, 'ﬁ', 'fi', 'ligatures'),
+        (STR, 'ﬀ', 'ff', 'ligatures'),
+        (STR, 'ﬂ', 'fl', 'ligatures'),
+        (STR, 'ĳ', 'ij', 'ligatures'),
         # remove pseudo-spaces in specific settings
-        (STR, '\u00A0%', '%'),
-        (STR, '\u00A0:', ':'),
-        (STR, '\u00A0?', '?'),
-        (STR, '\u00A0!', '!'),
-        (STR, '\u00A0;', ';'),
+        (STR, '\u00A0%', '%', 'spaces'),
+        (STR, '\u00A0:', ':', 'spaces'),
+        (STR, '\u00A0?', '?', 'spaces'),
+        (STR, '\u00A0!', '!', 'spaces'),
+        (STR, '\u00A0;', ';', 'spaces'),
         # numbers
-        (REG, r'(\d)[\u00A0,](\d)', r'\1\2'),  # remove non-breakable spaces or "," in numbers
+        (REG, r'(\d)[\u00A0,](\d)', r'\1\2', 'numbers'),  # remove non-breakable spaces or "," in numbers
         # German/Spanish/French "quotation", followed by comma, style
-        (REG, r'(\.+)"(\s*[^<])', r'"\1\2'),  # don't fix period at end of sentence TODO: what ??
-        (STR, ',"', '",'),
+        (REG, r'(\.+)"(\s*[^<])', r'"\1\2', 'punctuation'),  # don't fix period at end of sentence TODO: what ??
+        (STR, ',"', '",', 'punctuation'),
         # ensure , is not left alone
-        (STR, ' ,', ','),
-        (STR, ',', ', '),
+        (STR, ' ,', ',', 'punctuation'),
+        (STR, ',', ', ', 'punctuation'),
         # normalize space
-        (REG, spaces_pattern, ' '),
+        (REG, spaces_pattern, ' ', 'spaces'),
         # normalize spaces
-        (REG, r'(\d) \%', r'\1%'),
+        (REG, r'(\d) \%', r'\1%', 'numbers'),
         # the following is a very bad idea because of emojis
         # (STR, '(', ' ('),
         # (STR, ')', ') '),
@@ -105,15 +123,190 @@ normalization_patterns = [
         # (STR, ' :', ':'),
         # (STR, ' ;', ';'),
         # normalize spaces around, trying to avoid emojis and numbers, e.g. (arXiv:133)
-        (REG, r'([\w"\']) ?(:|;) ?([^\W\d]|["\'\n]|$)', r'\1\2 \3'),
-        (STR, ' , ', ', '),
-        (STR, ' .', '.'),  # TODO: useful ?
-        (REG, r'\( +(\w|\d)', r'(\1'),
-        (REG, r'(\w|\d) +\)', r'\1)'),
+        (REG, r'([\w"\']) ?(:|;) ?([^\W\d]|["\'\n]|$)', r'\1\2 \3', 'punctuation'),
+        (STR, ' , ', ', ', 'punctuation'),
+        (STR, ' .', '.', 'punctuation'),  # TODO: useful ?
+        (REG, r'\( +(\w|\d)', r'(\1', 'punctuation'),
+        (REG, r'(\w|\d) +\)', r'\1)', 'punctuation'),
     ]]
 
+#: the normalization patterns, as ``(REG|STR, pattern, replace)`` tuples
+normalization_patterns = [(t, r, s) for (t, r, s, _) in normalization_rules]
+#: the names of the groups of rules, in order of first appearance
+normalization_groups = list(OrderedDict.fromkeys(g for (_, _, _, g) in normalization_rules))
+
+
+#: A normalization pattern, as returned by :py:func:`compile_patterns`. The ``triggers`` are the characters
+#: a text must contain for the pattern to match (a tuple of sets, at least one character of each set is required),
+#: ``outputs`` the characters the replacement may introduce (``None`` if unknown, i.e. the replacement is a function).
+CompiledPattern = namedtuple('CompiledPattern', ['typ', 'pattern', 'replace', 'triggers', 'outputs'])
+
+
+class CompiledPatterns(list):
+    """
+    A list of :py:class:`CompiledPattern`, as returned by :py:func:`compile_patterns`.
+    The trigger characters are indexed into bit masks, so that checking which patterns may match is cheap.
+    """
+
+    def __init__(self, patterns):
+        super().__init__(patterns)
+        index = defaultdict(int)  # character => bits of the trigger sets it belongs to
+        required = []  # the bits to find in a text for each pattern to apply
+        bit = 1
+        for p in self:
+            mask = 0
+            for t in p.triggers:
+                for c in t:
+                    index[c] |= bit
+                mask |= bit
+                bit <<= 1
+            required.append(mask)
+        self.index = dict(index)
+        # flat tuples are cheaper to iterate over. Note: -1 has all bits set, i.e. if we don't know what
+        # a replacement produces, all the next patterns may apply
+        #: (triggers bit mask, outputs bit mask, typ, pattern, replace) of each pattern
+        self.stages = [
+            (mask, self.mask(p.outputs) if p.outputs is not None else -1, p.typ, p.pattern, p.replace)
+            for p, mask in zip(self, required)
+        ]
+
+    def mask(self, chars):
+        """Get the bit mask of all the trigger sets hit by the given characters."""
+        index = self.index
+        mask = 0
+        for c in chars:
+            mask |= index.get(c, 0)
+        return mask
+
+
+def compile_patterns(patterns):
+    """
+    Compile a list of normalization patterns (see :py:data:`normalization_patterns`) into an equivalent list of
+    :py:class:`CompiledPattern`, which knows which characters can trigger each pattern (see :py:func:`apply_patterns`).
+
+    Rules that can never change the text are dropped: a rule following another one that already deleted
+    every single character it matches (e.g. the second combining diacritics rule) won't find anything to replace.
 
-def normalize_text(text, fix_encoding=False, strip_emojis=False):
+    Note that merging the ``STR`` rules into a ``str.translate`` table or an alternation regex is *slower*:
+    ``str.replace`` uses a fast search, while the former look up every single character.
+
+    :param patterns: a list of ``(REG|STR, pattern, replace)`` tuples
+    :return: the :py:class:`CompiledPatterns` to pass to :py:func:`apply_patterns`
+    """
+    compiled = []
+    for typ, pattern, replace in patterns:
+        if compiled and compiled[-1][:2] == (typ, pattern) and compiled[-1].replace == '' \
+                and _is_single_char(typ, pattern):
+            continue
+        if typ == STR:
+            triggers = tuple(frozenset(c) for c in set(pattern))
+        else:
+            # case-insensitive patterns can match other characters than the ones they are written with
+            triggers = () if pattern.flags & re.IGNORECASE else \
+                _required_chars(sre_parse.parse(pattern.pattern, pattern.flags))
+        outputs = frozenset(replace) if isinstance(replace, str) else None
+        compiled.append(CompiledPattern(typ, pattern, replace, triggers, outputs))
+    return CompiledPatterns(compiled)
+
+
+def _is_single_char(typ, pattern):
+    # check if the pattern matches exactly one character, independently of its surroundings
+    if typ == STR:
+        return len(pattern) == 1
+    return [op for op, _ in sre_parse.parse(pattern.pattern, pattern.flags)] in ([sre_parse.IN], [sre_parse.LITERAL])
+
+
+def _required_chars(parsed, max_size=4096):
+    # Find the sets of characters any match of the parsed regex must contain (at least one character of each set).
+    # This is a conservative analysis: anything not understood (categories, negations, etc.) is simply ignored.
+    required = []
+    for op, av in parsed:
+        chars = None
+        if op == sre_parse.LITERAL:
+            chars = {chr(av)}
+        elif op == sre_parse.IN:
+            chars = set()
+            for item_op, item_av in av:
+                if item_op == sre_parse.LITERAL:
+                    chars.add(chr(item_av))
+                elif item_op == sre_parse.RANGE and item_av[1] - item_av[0] < max_size:
+                    chars.update(map(chr, range(item_av[0], item_av[1] + 1)))
+                else:
+                    chars = None  # negation, categories, huge ranges...
+                    break
+        elif op == sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:  # av[1]: the flags added, as in (?i:...)
+            required.extend(_required_chars(av[-1], max_size))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] > 0:
+            required.extend(_required_chars(av[2], max_size))
+        elif op == sre_parse.BRANCH:
+            # each alternative must require something, keep the smallest set of each
+            alternatives = [_required_chars(alt, max_size) for alt in av[1]]
+            if all(alternatives):
+                chars = set().union(*(min(alt, key=len) for alt in alternatives))
+        if chars and len(chars) <= max_size:
+            required.append(frozenset(chars))
+    return tuple(required)
+
+
+def apply_patterns(text, patterns, chars=None):
+    """
+    Apply a list of compiled normalization patterns to a text, in order.
+
+    :param text: the text
+    :param patterns: the :py:class:`CompiledPatterns` to apply, see :py:func:`compile_patterns`
+    :param chars: the set of characters found in text. If set, the patterns that can't match are skipped.
+    :return: the text with the patterns applied
+    """
+    if chars is None:
+        for typ, pattern, replace, _, _ in patterns:
+            text = pattern.sub(replace, text) if typ == REG else text.replace(pattern, replace)
+        return text
+
+    found = patterns.mask(chars)
+    for triggers, outputs, typ, pattern, replace in patterns.stages:
+        if found & triggers != triggers:
+            continue  # this pattern can't match, skip it
+        found |= outputs
+        text = pattern.sub(replace, text) if typ == REG else text.replace(pattern, replace)
+    return text
+
+
+def strip_lines(text):
+    r"""
+    Strip spaces in the beginning and end of each line and remove blank lines, in one pass.
+    This is equivalent to (but way faster than) ``re.sub(r'(^|\n)\s+', r'\1', text)``
+    followed by ``re.sub(r'\s+(\n|$)', r'\1', text)``.
+    """
+    return '\n'.join(line for line in (l.strip() for l in text.split('\n')) if line)
+
+
+_final_spaces_rule = (REG, spaces_pattern, ' ', 'spaces')
+
+#: :py:data:`normalization_patterns` compiled, with the final space normalization
+compiled_patterns = compile_patterns(normalization_patterns + [_final_spaces_rule[:3]])
+
+
+def get_compiled_patterns(groups=None):
+    """
+    Get the compiled normalization patterns (with the final space normalization) of a subset of rule groups.
+
+    :param groups: the groups of rules to keep (see :py:data:`normalization_groups`), default to all
+    :return: the :py:class:`CompiledPatterns`, compiled only once for each subset
+    """
+    if groups is None:
+        return compiled_patterns
+    return _compile_groups(frozenset(groups))
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_groups(groups):
+    unknown = groups.difference(normalization_groups)
+    if unknown:
+        raise ValueError(f'Unknown normalization group(s): {", ".join(sorted(unknown))}.')
+    return compile_patterns([(t, r, s) for (t, r, s, g) in normalization_rules + [_final_spaces_rule] if g in groups])
+
+
+def normalize_text(text, fix_encoding=False, strip_emojis=False, profile=None, groups=None):
     """
     Normalize text:
 
@@ -135,60 +328,355 @@ def normalize_text(text, fix_encoding=False, strip_emojis=False):
     :param text: the text to normalize, newlines will be preserved;
     :param fix_encoding: if set, use ftfy to fix encoding issues on a per-sentence basis;
     :param strip_emojis: if set, try to find and strip unicode emojis;
+    :param profile: if set, a :py:class:`PatternsProfile` used to collect statistics about each pattern (slower);
+    :param groups: the groups of rules to apply (see :py:data:`normalization_groups`), default to all;
     :return: the normalized text
     """
-    # optionally fix encoding using ftfy
-    if fix_encoding and wrong_encoding_pattern.search(text) is not None:
+    return _normalize(
+        text,
+        patterns=get_compiled_patterns(groups),
+        fix_encoding=_fix_encoding if fix_encoding else None,
+        strip_emojis=strip_emojis,
+        apply=profile.apply_patterns if profile is not None else apply_patterns)
+
+
+def make_normalizer(fix_encoding=False, strip_emojis=False, profile=None, groups=None):
+    """
+    Build a normalization function specialized for the given options (see :py:meth:`normalize_text`):
+    the options are checked, the patterns of the selected groups compiled and ftfy imported once and for all,
+    so each call only does the actual work.
+
+    :return: a function taking a text and returning the normalized text
+    """
+    fixer = None
+    if fix_encoding:
+        try:
+            import ftfy
+            fixer = functools.partial(_fix_encoding, ftfy=ftfy)
+        except ModuleNotFoundError:
+            print('WARNING: norm_punc.py, fixing encoding requires the ftfy package: pip install ftfy.')
+
+    return functools.partial(
+        _normalize,
+        patterns=get_compiled_patterns(groups),
+        fix_encoding=fixer,
+        strip_emojis=strip_emojis,
+        apply=profile.apply_patterns if profile is not None else apply_patterns)
+
+
+def _fix_encoding(text, ftfy=None):
+    # fix encoding using ftfy, on a per-sentence basis and only if the text seems to need it
+    if wrong_encoding_pattern.search(text) is None:
+        return text
+    if ftfy is None:
         try:
             import ftfy
-            text = '\n'.join(
-                ftfy.fix_encoding(t) if wrong_encoding_pattern.search(t) is not None else t
-                for t in text.split('\n')
-            )
         except ModuleNotFoundError:
             print('WARNING: norm_punc.py, fixing encoding requires the ftfy package: pip install ftfy.')
+            return text
+    return '\n'.join(
+        ftfy.fix_encoding(t) if wrong_encoding_pattern.search(t) is not None else t
+        for t in text.split('\n')
+    )
+
+
+def _normalize(text, patterns, fix_encoding, strip_emojis, apply):
+    # The actual implementation of normalize_text: fix_encoding is either None or a function,
+    # apply is either apply_patterns or PatternsProfile.apply_patterns
+
+    # optionally fix encoding using ftfy
+    if fix_encoding is not None:
+        text = fix_encoding(text)
+
+    # the set of characters found in the text lets us skip all the patterns that can't match
+    chars = set(text)
+    max_char = max(chars) if chars else ' '
 
-    # normalize (e.g. combining diacritics)
-    text = unicodedata.normalize('NFC', text)
+    # normalize (e.g. combining diacritics), an ASCII text is always in NFC form
+    if max_char > '\x7f':
+        normalized = unicodedata.normalize('NFC', text)
+        if normalized != text:
+            text = normalized
+            chars = set(text)
+            max_char = max(chars)
 
     # optionally strip emojis
-    if strip_emojis:
+    if strip_emojis and max_char >= '\u2300':
         # I formally used the emoji library, which is really nice but slooooow (and doesn't cover ASCII misc symbols).
         # I thus preferred to use a simpler regex that covers most cases is is waaaay faster
         # (203ms to process 164343 short sentences, against 31s with emoji)
         text = emoji_pattern.sub(' ', text)
+        chars.add(' ')
 
-    # apply patterns in order
-    for i, (typ, pattern, replace) in enumerate(normalization_patterns):
-        if typ == REG:
-            text = pattern.sub(replace, text)
-        else:
-            text = text.replace(pattern, replace)
-
-    # normalize spaces
-    text = spaces_pattern.sub(' ', text)
+    # apply patterns in order, then normalize spaces
+    text = apply(text, patterns, chars)
 
     # don't forget to normalise spaces in the beginning and end
-    text = re.sub(r'(^|\n)\s+', r'\1', text)
-    text = re.sub(r'\s+(\n|$)', r'\1', text)
+    text = strip_lines(text)
 
     return text
 
 
+def normalize_stream(stream, chunk_size=1 << 20, **kwargs):
+    """
+    Normalize a stream of text (e.g. an open file, or any iterable of lines or pieces of text) using
+    :py:meth:`normalize_text`, in line-aligned blocks of about ``chunk_size`` characters. The memory used thus
+    stays bounded by the chunk size (plus the length of the longest line) and the results are available as soon
+    as each block is processed.
+
+    Since each line is normalized independently, the output is exactly the same as with :py:meth:`normalize_text`,
+    that is ``''.join(normalize_stream(stream)) == normalize_text(''.join(stream))``.
+
+    :param stream: an iterable of strings. Note that newlines are *not* added between elements.
+    :param chunk_size: the minimal number of characters to accumulate before processing a block
+    :param kwargs: extra options to pass to :py:meth:`normalize_text`
+    :return: a generator of normalized pieces of text
+    """
+    return _normalize_stream(stream, chunk_size, functools.partial(normalize_text, **kwargs))
+
+
+def _normalize_stream(stream, chunk_size, normalize):
+    # The actual implementation of normalize_stream, normalize is a function taking and returning a text
+    buffer, size = [], 0
+    first = True
+    for piece in stream:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size and '\n' in piece:
+            # process all complete lines (keeping the last newline, as the patterns may look ahead),
+            # and keep the rest for the next block
+            block = ''.join(buffer)
+            cut = block.rindex('\n') + 1
+            buffer = [block[cut:]]
+            size = len(buffer[0])
+            text = normalize(block[:cut])
+            if text:
+                yield text if first else '\n' + text
+                first = False
+
+    text = normalize(''.join(buffer))
+    if text:
+        yield text if first else '\n' + text
+
+
+class PatternsProfile:
+    """
+    Collect statistics about each normalization pattern: the number of calls, how many were skipped
+    (i.e. the text didn't contain the pattern's trigger characters), how many changed the text,
+    the number of characters they matched and their cumulative wall time.
+
+    To use it, pass an instance to :py:meth:`normalize_text` (or :py:class:`Normalizer`) using the ``profile`` option.
+    Note that lines served from a :py:class:`LineCache` are not recorded. Texts normalized in other processes
+    (see :py:meth:`Normalizer.imap_normalize`) are recorded in the workers, then merged into this profile.
+    """
+
+    def __init__(self):
+        self.stats = OrderedDict()  #: statistics of each pattern (see :py:meth:`describe`), in order of application
+
+    @staticmethod
+    def describe(index, pattern):
+        """
+        Get a human-readable description of a :py:class:`CompiledPattern`, used as key in :py:attr:`stats`.
+        The index (position in the compiled list) is included, as the same pattern may be applied twice.
+        """
+        if pattern.typ == REG:
+            return f'#{index:02d} REG {pattern.pattern.pattern!r} => {pattern.replace!r}'
+        return f'#{index:02d} STR {pattern.pattern!r} => {pattern.replace!r}'
+
+    def apply_patterns(self, text, patterns, chars=None):
+        """Same as :py:func:`apply_patterns`, but collecting statistics."""
+        found = patterns.mask(chars) if chars is not None else -1
+        for i, (compiled, (triggers, outputs, typ, pattern, replace)) in enumerate(zip(patterns, patterns.stages)):
+            rule = self.describe(i, compiled)
+            stats = self.stats.get(rule)
+            if stats is None:
+                stats = self.stats[rule] = dict(calls=0, skipped=0, changed=0, chars=0, time=0.)
+            stats['calls'] += 1
+            if found & triggers != triggers:
+                stats['skipped'] += 1
+                continue
+            found |= outputs
+            start = time.perf_counter()
+            new_text = pattern.sub(replace, text) if typ == REG else text.replace(pattern, replace)
+            stats['time'] += time.perf_counter() - start
+            if new_text != text:
+                stats['changed'] += 1
+                if typ == REG:
+                    stats['chars'] += sum(m.end() - m.start() for m in pattern.finditer(text))
+                else:
+                    stats['chars'] += text.count(pattern) * len(pattern)
+            text = new_text
+        return text
+
+    def merge(self, other):
+        """Add the statistics of another profile (e.g. from another process) to this one."""
+        for rule, other_stats in other.stats.items():
+            stats = self.stats.setdefault(rule, dict.fromkeys(other_stats, 0))
+            for k, v in other_stats.items():
+                stats[k] += v
+
+    def clear(self):
+        """Remove all the statistics."""
+        self.stats.clear()
+
+    def to_json(self, **kwargs):
+        """Dump the statistics as a JSON list, one object per pattern."""
+        return json.dumps([dict(rule=rule, **stats) for rule, stats in self.stats.items()], **kwargs)
+
+    def to_table(self):
+        """Format the statistics as a table, most expensive patterns first."""
+        lines = [f'{"time (ms)":>10s} {"calls":>8s} {"skipped":>8s} {"changed":>8s} {"chars":>8s}  rule']
+        for rule, stats in sorted(self.stats.items(), key=lambda item: -item[1]['time']):
+            lines.append('{:10.2f} {calls:8d} {skipped:8d} {changed:8d} {chars:8d}  {}'.format(
+                stats['time'] * 1000, rule, **stats))
+        return '\n'.join(lines)
+
+
+class LineCache(LRUCache):
+    """
+    A :py:class:`~phrasal.utils.LRUCache` of normalized lines, keyed by ``(line, options)`` and bounded by both
+    the number of entries and their size in bytes (line + normalized line, as reported by ``sys.getsizeof``).
+    """
+
+    def __init__(self, max_entries=100_000, max_bytes=64 << 20):
+        super().__init__(max_entries, max_bytes)
+
+    def sizeof(self, key, value):
+        return sys.getsizeof(key[0]) + sys.getsizeof(value)
+
+
 class Normalizer():
     """A wrapper around :py:meth:`normalize_text`"""
 
-    def __init__(self, **kwargs):
-        """Initialize a normalizer. The ``kwargs`` will be passed to :py:meth:`normalize_text` as-is. """
+    def __init__(self, cache_size=0, cache_bytes=64 << 20, **kwargs):
+        """
+        Initialize a normalizer. The ``kwargs`` will be passed to :py:meth:`normalize_text` as-is.
+        Use the ``groups`` option to only apply some groups of rules (see :py:data:`normalization_groups`).
+
+        The normalization is specialized for those options once, at construction (see :py:meth:`make_normalizer`).
+        Calls overriding some options fall back to the generic :py:meth:`normalize_text`.
+
+        If ``cache_size`` is set, texts are normalized line by line and the results are kept in a :py:class:`LineCache`,
+        so repeated lines (menus, footers, etc.) only cost one lookup. The output is the same in any case.
+
+        :param cache_size: the maximum number of lines to cache, 0 to disable the cache
+        :param cache_bytes: the maximum size of the cache, in bytes
+        """
         self.kwargs = kwargs  #: extra options to pass to :py:meth:`normalize_text`
+        #: the cache of normalized lines, if enabled
+        self.cache = LineCache(cache_size, cache_bytes) if cache_size > 0 else None
+        self._setup()
+
+    def _setup(self):
+        self._normalize = make_normalizer(**self.kwargs)
+        self._flags = self._cache_flags(self.kwargs)
+
+    def __getstate__(self):
+        # the specialized function may hold unpicklable modules (ftfy), it is rebuilt on unpickling
+        state = self.__dict__.copy()
+        del state['_normalize'], state['_flags']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    @staticmethod
+    def _cache_flags(options):
+        # a hashable version of the options, to use in the cache keys
+        return tuple(sorted((k, frozenset(v) if k == 'groups' and v is not None else v) for k, v in options.items()))
+
+    def _get_normalize(self, kwargs):
+        # get the normalize function and the cache flags to use, given the options to override
+        if not kwargs:
+            return self._normalize, self._flags
+        options = dict(**self.kwargs)
+        options.update(kwargs)
+        return functools.partial(normalize_text, **options), self._cache_flags(options)
 
     def normalize(self, text, **kwargs):
         """Call :py:meth:`normalize_text` on ``text`` with the extra :py:attr:`kwargs` options."""
-        options = self.kwargs
-        if kwargs:
-            options = dict(**self.kwargs)
-            options.update(kwargs)
-        return normalize_text(text, **options)
+        normalize, flags = self._get_normalize(kwargs)
+        if self.cache is not None:
+            return self._normalize_cached(text, normalize, flags)
+        return normalize(text)
+
+    def _normalize_cached(self, text, normalize, flags):
+        # Normalize each line independently, using the cache. Lines keep their newline (patterns may look ahead),
+        # so the result is exactly the same as normalizing the whole text at once.
+        cache = self.cache
+        lines = text.split('\n')
+        last = len(lines) - 1
+        results = []
+        for i, line in enumerate(lines):
+            if not line or line.isspace():
+                continue
+            if i < last:
+                line += '\n'
+            key = (line, flags)
+            normalized = cache.get(key)
+            if normalized is None:
+                normalized = normalize(line)
+                cache.put(key, normalized)
+            if normalized:
+                results.append(normalized)
+        return '\n'.join(results)
+
+    def normalize_stream(self, stream, chunk_size=1 << 20, **kwargs):
+        """Call :py:meth:`normalize_stream` on ``stream`` with the extra :py:attr:`kwargs` options."""
+        if self.cache is None:
+            return _normalize_stream(stream, chunk_size, self._get_normalize(kwargs)[0])
+        return _normalize_stream(stream, chunk_size, functools.partial(self.normalize, **kwargs))
+
+    def normalize_all(self, texts, workers=1, chunksize=None, **kwargs):
+        """
+        Normalize a list of texts, preserving the order.
+
+        :param texts: the texts to normalize
+        :param workers: the number of processes to use (see :py:meth:`imap_normalize`), default to one (no pool)
+        :param chunksize: the number of texts to send to a worker at once, see :py:meth:`imap_normalize`
+        :param kwargs: override the :py:attr:`kwargs` options
+        :return: the list of normalized texts
+        """
+        if workers == 1:
+            return [self.normalize(t, **kwargs) for t in texts]
+        return list(self.imap_normalize(texts, workers, chunksize, **kwargs))
+
+    def imap_normalize(self, texts, workers=None, chunksize=None, ordered=True, **kwargs):
+        """
+        Lazily normalize an iterable of texts using a pool of processes.
+
+        Texts are shipped to the workers in batches of ``chunksize``, so the pickling/IPC overhead is paid once
+        per batch instead of once per text. Each worker gets its own copy of this normalizer when it starts.
+
+        :param texts: an iterable of texts to normalize
+        :param workers: the number of processes, default to the number of CPUs
+        :param chunksize: the number of texts per batch. By default, about four batches per worker if the length of
+            ``texts`` is known, else 64
+        :param ordered: if unset, the normalized texts are yielded as soon as they are ready, in any order
+        :param kwargs: override the :py:attr:`kwargs` options
+        :return: a generator of normalized texts
+        """
+        if chunksize is None:
+            chunksize = max(1, len(texts) // ((workers or os.cpu_count()) * 4)) if hasattr(texts, '__len__') else 64
+        profile = kwargs.get('profile', self.kwargs.get('profile'))
+        with worker_pool(workers, self) as pool:
+            imap = pool.imap if ordered else pool.imap_unordered
+            if profile is None:
+                yield from imap(in_worker('normalize', **kwargs), texts, chunksize)
+                return
+            # each worker profiles into its own copy: send it back with each batch, and merge it into ours
+            it = iter(texts)
+            batches = iter(lambda: list(itertools.islice(it, chunksize)), [])
+            for results, worker_profile in imap(in_worker('_normalize_profiled', **kwargs), batches):
+                profile.merge(worker_profile)
+                yield from results
+
+    def _normalize_profiled(self, texts, **kwargs):
+        # normalize a batch of texts in a worker process, returning the statistics of this batch along with the results
+        profile = kwargs.get('profile', self.kwargs.get('profile'))
+        profile.clear()  # the first time, it holds the statistics of the parent process
+        return [self.normalize(text, **kwargs) for text in texts], profile
 
 
 # ---
@@ -202,11 +690,28 @@ def main():
     parser.add_argument('-fe', '--fix-encoding', default=False, action='store_true')
     parser.add_argument('-se', '--strip-emojis', default=False, action='store_true')
     parser.add_argument('-o', '--out', type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('-c', '--chunk-size', type=int, default=None,
+                        help='stream the input in blocks of about this many characters (default: read all at once)')
+    parser.add_argument('-p', '--profile', choices=['table', 'json'], default=None,
+                        help='print statistics about each normalization pattern to stderr')
+    parser.add_argument('-g', '--groups', nargs='+', choices=normalization_groups, default=None,
+                        help='only apply those groups of rules (default: all)')
     args = parser.parse_args()
 
+    profile = PatternsProfile() if args.profile else None
+
     try:
-        text = normalize_text(args.i.read(), fix_encoding=args.fix_encoding, strip_emojis=args.strip_emojis)
-        args.out.write(text)
+        normalizer = Normalizer(
+            fix_encoding=args.fix_encoding, strip_emojis=args.strip_emojis, profile=profile, groups=args.groups)
+        if args.chunk_size:
+            for text in normalizer.normalize_stream(args.i, chunk_size=args.chunk_size):
+                args.out.write(text)
+        else:
+            text = normalizer.normalize(args.i.read())
+            args.out.write(text)
     except ModuleNotFoundError as e:
         print(e)
         exit(1)
+
+    if profile is not None:
+        print(profile.to_table() if args.profile == 'table' else profile.to_json(indent=2), file=sys.stderr)
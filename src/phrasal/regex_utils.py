@@ -0,0 +1,353 @@
+"""
+This module compiles patterns written for the `regex <https://pypi.org/project/regex/>`_ module (version V0) using the
+fastest engine available: the standard ``re`` module when the pattern can be translated exactly, ``regex`` otherwise.
+
+``re`` has a lower overhead per call and is often faster on simple patterns (literals, small character sets),
+but doesn't support unicode properties such as ``\\p{Pf}``. The translation replaces those (and the shorthands
+``\\s``, ``\\d``, whose definitions differ between the two modules) by the explicit set of characters ``regex``
+would match, so the behavior is exactly the same. Large sets (e.g. ``\\p{L}``, thousands of characters) are
+however slower under ``re``, so patterns using them are left to ``regex``. So are patterns using any syntax
+whose semantics could differ (``\\w``, ``\\b``, flags, possessive quantifiers, etc.). The choice only depends on
+the pattern, so it is the same on every machine.
+
+Translating a pattern means finding the characters matched by its unicode classes, which takes a few milliseconds.
+Patterns are thus compiled lazily, on first use: compiling patterns at import time costs nothing.
+
+Usage::
+
+    from phrasal.regex_utils import compile_pattern
+    pattern = compile_pattern(r'[\\'\\"\\)\\]\\p{Pf}]+ ')  # translated, compiled with re on first use
+    pattern = compile_pattern(r'\\p{L}+')  # too large a set, compiled with regex on first use
+
+"""
+import array
+import re
+
+import regex
+
+#: above this number of characters and ranges, a character class is considered too large to be faster under re
+MAX_CLASS_ITEMS = 128
+
+# escapes that stand for a character class, expanded to explicit characters (uppercase = negated)
+_CLASS_ESCAPES = 'sSdD'
+# escapes of a single character, with the same meaning in re and regex
+_CHAR_ESCAPES = 'tnrf'
+_HEX_ESCAPES = dict(x=2, u=4, U=8)
+# group extensions with the same meaning in re and regex
+_GROUP_EXTENSIONS = ('(?:', '(?=', '(?!', '(?<=', '(?<!', '(?P<', '(?P=')
+
+# the type of re compiled patterns (re.Pattern is only available since Python 3.7)
+_RE_PATTERN = type(re.compile(''))
+
+# the patterns returned by compile_pattern so far, by (pattern, flags, engine)
+_compiled = dict()
+# the re set items of the class escapes found so far, see _class_items
+_class_items_cache = dict()
+# a class escape in a pattern (e.g. \p{Pf} or \S)
+_CLASS_ESCAPE = re.compile(r'\\([pP]\{[^}]*\}|[%s])' % _CLASS_ESCAPES)
+
+
+def _all_characters() -> str:
+    # all the unicode code points, surrogates included, built plane by plane from their utf-32 encoding
+    planes = bytearray(array.array('I', range(0x10000)).tobytes() * 17)
+    planes[2::4] = b''.join(bytes([plane]) * 0x10000 for plane in range(17))
+    return planes.decode('utf-32-le', 'surrogatepass')
+
+
+def _class_items(escape: str):
+    """
+    Return the characters matched by a class escape (e.g. ``\\p{Pf}`` or ``\\s``) under regex, as a list of
+    re set items (characters or ranges), or None if there are more than :py:data:`MAX_CLASS_ITEMS`.
+
+    This means scanning all the unicode characters, a ~4 MB string which is not kept. The class escapes of all
+    the patterns not compiled yet are thus looked up at the same time.
+    """
+    if escape not in _class_items_cache:
+        characters = _all_characters()
+        _class_items_cache[escape] = _find_class_items(escape, characters)
+        for other in _pending_class_escapes() - _class_items_cache.keys():
+            try:
+                _class_items_cache[other] = _find_class_items(other, characters)
+            except regex.error:
+                pass  # e.g. unknown property: the error will be raised when compiling the pattern
+    return _class_items_cache[escape]
+
+
+def _find_class_items(escape: str, characters: str):
+    items = []
+    for match in regex.finditer(escape + '+', characters):
+        start, end = match.start(), match.end() - 1
+        items.append(_escape(start) if start == end else f'{_escape(start)}-{_escape(end)}')
+        if len(items) > MAX_CLASS_ITEMS:
+            return None
+    return items
+
+
+def _pending_class_escapes():
+    # the class escapes (not negated) of the patterns returned by compile_pattern that may be translated later
+    escapes = set()
+    for lazy in list(_compiled.values()):
+        pattern, flags, engine = lazy._args
+        if lazy._compiled is None and not flags and engine == 're':
+            escapes.update('\\' + m[1][0].lower() + m[1][1:] for m in _CLASS_ESCAPE.finditer(pattern))
+    return escapes
+
+
+def _escape(codepoint: int) -> str:
+    return f'\\U{codepoint:08x}'
+
+
+def _class_translation(escape: str, negated: bool, in_set: bool):
+    # the explicit set of characters matched by a class escape, or None if too large or not representable
+    items = _class_items(escape)
+    if items is None or (negated and in_set):
+        return None
+    if in_set:
+        return ''.join(items)
+    return '[%s%s]' % ('^' if negated else '', ''.join(items))
+
+
+def _read_escape(pattern: str, i: int, in_set: bool):
+    """
+    Translate the escape starting at pattern[i] (a backslash).
+
+    :return: a tuple (translation, position after the escape), the translation being None if the
+        escape is not supported
+    """
+    c = pattern[i + 1:i + 2]
+    if c and c in 'pP':
+        end = pattern.find('}', i)
+        if pattern[i + 2:i + 3] != '{' or end < 0:
+            return None, i + 2
+        return _class_translation('\\p' + pattern[i + 2:end + 1], c == 'P', in_set), end + 1
+    if c and c in _CLASS_ESCAPES:
+        return _class_translation('\\' + c.lower(), c.isupper(), in_set), i + 2
+    if c and c in _HEX_ESCAPES:
+        end = i + 2 + _HEX_ESCAPES[c]
+        digits = pattern[i + 2:end]
+        if len(digits) != _HEX_ESCAPES[c] or any(d not in '0123456789abcdefABCDEF' for d in digits):
+            return None, end
+        return pattern[i:end], end
+    if c and c in _CHAR_ESCAPES:
+        return pattern[i:i + 2], i + 2
+    if c and c in '123456789' and not in_set and not pattern[i + 2:i + 3].isdigit():
+        return pattern[i:i + 2], i + 2  # backreference
+    if not c or (c < '\x80' and c.isalnum()):
+        return None, i + 2  # any other escape: \w, \b, \A, \X, \N{...}, octal, etc.
+    return pattern[i:i + 2], i + 2  # escaped symbol
+
+
+def _read_set(pattern: str, i: int):
+    """Translate the character set starting at pattern[i] (an opening bracket), or return None."""
+    out = ['[']
+    i += 1
+    if pattern[i:i + 1] == '^':
+        out.append('^')
+        i += 1
+    if pattern[i:i + 1] == ']':
+        return None, i  # a literal ] as first item: not worth the hassle
+    while i < len(pattern):
+        c = pattern[i]
+        if c == ']':
+            return ''.join(out) + ']', i + 1
+        if c == '[':
+            return None, i  # nested sets or posix classes
+        if c == '\\':
+            translation, i = _read_escape(pattern, i, in_set=True)
+            if translation is None:
+                return None, i
+            out.append(translation)
+        else:
+            out.append(c)
+            i += 1
+    return None, i
+
+
+def translate(pattern: str):
+    """
+    Translate a regex (V0) pattern into an equivalent re pattern.
+
+    :param pattern: the pattern (as a string)
+    :return: the re pattern, or None if it can't be translated exactly (or uses sets too large to be faster)
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            translation, i = _read_escape(pattern, i, in_set=False)
+        elif c == '[':
+            translation, i = _read_set(pattern, i)
+        elif c == '(' and pattern.startswith('(?', i):
+            translation = next((ext for ext in _GROUP_EXTENSIONS if pattern.startswith(ext, i)), None)
+            i += len(translation) if translation else 2
+        elif c in '*+?}' and pattern[i + 1:i + 2] == '+':
+            translation = None  # possessive quantifier
+        else:
+            translation = c
+            i += 1
+        if translation is None:
+            return None
+        out.append(translation)
+
+    translated = ''.join(out)
+    try:
+        re.compile(translated)
+    except re.error:
+        return None  # e.g. variable-width look-behind
+    return translated
+
+
+def compile_pattern(pattern: str, flags=0, engine='re'):
+    """
+    Compile a regex (V0) pattern with re if it can be translated exactly (see :py:func:`translate`),
+    with regex otherwise. The pattern is only translated and compiled on first use (see :py:class:`LazyPattern`),
+    and the same instance is returned for the same arguments.
+
+    :param pattern: the pattern (as a string)
+    :param flags: regex flags: if any, the pattern is always compiled with regex
+    :param engine: ``re`` to use re whenever the pattern can be translated, ``regex`` to always use regex
+    :return: the compiled pattern
+    """
+    if engine not in ('re', 'regex'):
+        raise ValueError(f'Unknown engine {engine}. Valid engines are: re, regex.')
+    key = (pattern, flags, engine)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = LazyPattern(pattern, flags, engine)
+    return compiled
+
+
+class LazyPattern:
+    """
+    A pattern compiled on first use, as returned by :py:func:`compile_pattern`. It offers the same attributes and
+    methods as the compiled pattern (``search``, ``finditer``, ``sub``, ``pattern``...): they are copied to the
+    instance the first time they are accessed, so later accesses cost a plain attribute lookup.
+    """
+
+    def __init__(self, pattern: str, flags=0, engine='re'):
+        self._args = (pattern, flags, engine)
+        self._compiled = None
+
+    def compiled(self):
+        """Return the compiled pattern, either a ``re.Pattern`` or a ``regex.Pattern``."""
+        if self._compiled is None:
+            self._compiled = _compile(*self._args)
+        return self._compiled
+
+    def __getattr__(self, name):
+        # only called for the attributes not found on the instance yet
+        if name.startswith('_'):
+            raise AttributeError(name)
+        value = self.__dict__[name] = getattr(self.compiled(), name)
+        return value
+
+    def __reduce__(self):
+        return compile_pattern, self._args
+
+    def __repr__(self):
+        return repr(self.compiled())
+
+
+def dump_compiled(patterns) -> list:
+    """
+    Describe how patterns returned by :py:func:`compile_pattern` were compiled, so they can be compiled again
+    without translation in another process (see :py:func:`load_compiled`).
+
+    :param patterns: the compiled patterns
+    :return: a JSON-serializable list of ``[pattern, flags, engine, module, compiled pattern, compiled flags]``
+    """
+    patterns = set(patterns)
+    entries = []
+    for key, lazy in _compiled.items():
+        if lazy in patterns:
+            compiled = lazy.compiled()
+            entries.append([*key, 're' if isinstance(compiled, _RE_PATTERN) else 'regex', compiled.pattern,
+                            compiled.flags])
+    return entries
+
+
+def load_compiled(entries):
+    """
+    Compile the patterns described by :py:func:`dump_compiled`, so that :py:func:`compile_pattern` returns them
+    directly.
+
+    :param entries: the list returned by :py:func:`dump_compiled`
+    """
+    for pattern, flags, engine, module, compiled, compiled_flags in entries:
+        lazy = compile_pattern(pattern, flags, engine)
+        if lazy._compiled is None:
+            lazy._compiled = (re.compile if module == 're' else regex.compile)(compiled, compiled_flags)
+
+
+def _compile(pattern: str, flags: int, engine: str):
+    translated = translate(pattern) if not flags and engine != 'regex' else None
+    if translated is None:
+        return regex.compile(pattern, flags)
+    return re.compile(translated)
+
+
+# a quantifier: ?, *, + or {n}, {n,}, {n,m}, optionally lazy or possessive
+_QUANTIFIER = re.compile(r'(?:[?*+]|\{(\d+)(,(\d*))?\})[?+]?')
+
+
+def _repeats(pattern: str, i: int):
+    """
+    Parse the quantifier at pattern[i], if any.
+
+    :return: a tuple (length of the quantifier, min repeats, max repeats or None if unbounded). Possessive
+        quantifiers never backtrack, so they are reported as matching exactly once.
+    """
+    match = _QUANTIFIER.match(pattern, i)
+    if match is None or match[0][-1] == '+' and len(match[0]) > 1:
+        return (len(match[0]) if match else 0), 1, 1
+    if match[1] is None:
+        return len(match[0]), int(match[0][0] == '+'), None if match[0][0] in '*+' else 1
+    n = int(match[1])
+    return len(match[0]), n, n if match[2] is None else int(match[3]) if match[3] else None
+
+
+def _skip_set(pattern: str, i: int) -> int:
+    # return the position after the character set starting at pattern[i]
+    i += 2 if pattern.startswith('[^', i) else 1
+    i += pattern[i:i + 1] == ']'
+    while i < len(pattern) and pattern[i] != ']':
+        i += 2 if pattern[i] == '\\' else 1
+    return i + 1
+
+
+def nested_quantifiers(pattern: str):
+    """
+    Find the groups repeated without bound (``*``, ``+`` or ``{n,}``) that contain a variable repetition,
+    e.g. ``(a+)+`` or ``(\\w+\\s?)*``. Such patterns may backtrack catastrophically, i.e. take exponential time
+    to fail on some inputs. Possessive quantifiers (e.g. ``(a++b)+``) don't backtrack and are thus ignored.
+
+    :param pattern: the pattern (as a string)
+    :return: the offending groups (with their quantifier), as a list of substrings of the pattern
+    """
+    found = []
+    groups = []  # for each open group, its start and whether it contains a variable repetition
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 2
+        elif c == '[':
+            i = _skip_set(pattern, i)
+        elif c == '(':
+            groups.append([i, False])
+            i += 3 if pattern.startswith('(?', i) else 1  # skip the extension, e.g. (?: or (?=
+        elif c == ')' and groups:
+            start, variable = groups.pop()
+            length, min_repeats, max_repeats = _repeats(pattern, i + 1)
+            if variable and max_repeats is None:
+                found.append(pattern[start:i + 1 + length])
+            if groups and (variable or min_repeats != max_repeats):
+                groups[-1][1] = True
+            i += 1 + length
+        else:
+            length, min_repeats, max_repeats = _repeats(pattern, i)
+            if min_repeats != max_repeats and groups:
+                groups[-1][1] = True
+            i += max(length, 1)
+    return found
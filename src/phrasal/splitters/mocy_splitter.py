@@ -21,10 +21,11 @@ import os
 import re
 import sys
 
-import regex
 import logging
 
 from ..interfaces import ISplitter
+from ..regex_utils import compile_pattern
+from ..utils import LRUCache, in_worker, iter_lines, worker_pool
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +39,36 @@ _NUMERIC_ONLY = 2  #: the prefix applies only when followed by number(s)
 # * \p{IsPi} => \p{Pi} or \p{Initial_Punctuation}: any kind of opening quote.
 # * \p{IsPf} => \p{Pf} or \p{Final_Punctuation}: any kind of closing quote.
 
+# Patterns used by split_paragraph, compiled once (see the method for details). Patterns searched through whole
+# paragraphs and starting with a rare character are faster with regex, which skips quickly to the possible matches
+_multi_spaces_pattern = re.compile(' {2,}')
+_more_pattern = compile_pattern(r'([\:;])([^\d\)\(/-])')
+_question_pattern = compile_pattern(r'([\?!]+)([^\?!\p{Pe}\p{Pf}\"])', engine='regex')
+_multi_dots_pattern = compile_pattern(r'(\.[\.]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\p{L}])')
+_quoted_end_pattern = compile_pattern(r'([?!\.][\ ]*[\'\"\)\]\p{Pf}]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\ ]*[\p{Lu}])')
+_punct_end_pattern = compile_pattern(r'([?!\.]) +([\'\"\(\[\¿\¡\p{Pi}]+[\ ]*[\p{L}])')
+_period_word_pattern = compile_pattern(r'([\p{IsAlnum}\.\-]*)([\'\"\)\]\%\p{Pf}]*)(\.+)$')
+_acronym_pattern = compile_pattern(r'(\.)[\p{IsUpper}\-]+(\.+)$')
+_sentence_start_pattern = compile_pattern(r'([ ]*[\'\"\(\[\¿\¡\p{Pi}]*[ ]*[\p{L}0-9])')
+_number_start_pattern = compile_pattern('[0-9]+')
+
+# Patterns used by scan_paragraph. The candidates are runs of :; (more), runs of ?! and the spaces
+# following a period or a closing quote/parenthesis. Everything else is decided locally, around each candidate.
+_candidates_pattern = compile_pattern(r'[\:;]+|[\?!]+|(?<=[\.\'\"\)\]\p{Pf}]) ', engine='regex')
+_more_next_pattern = compile_pattern(r'[^\d\)\(/-]')
+_question_next_pattern = compile_pattern(r'[^\?!\p{Pe}\p{Pf}\"]')
+_closer_pattern = compile_pattern(r'[\'\"\)\]\p{Pf}]')
+_closers_pattern = compile_pattern(r'[\'\"\)\]\p{Pf}]+ ')
+_multi_dots_next_pattern = compile_pattern(r'[\'\"\(\[\¿\¡\p{Pi}]*[\p{L}]')
+_quoted_end_next_pattern = compile_pattern(r'[\'\"\(\[\¿\¡\p{Pi}]*[\ ]*[\p{Lu}]')
+_punct_end_next_pattern = compile_pattern(r'[\'\"\(\[\¿\¡\p{Pi}]+[\ ]*[\p{L}]')
+
+# Used by split_spans to skip the whitespace stripped from the sentences
+_whitespace_pattern = re.compile(r'\s*')
+
+# Used by split to find paragraph boundaries when keep_newlines is unset
+_blank_line_pattern = re.compile(r'\n[^\S\n]*\n')
+
 
 class MocySplitter(ISplitter):
     """
@@ -51,7 +82,10 @@ class MocySplitter(ISplitter):
 
     """
 
-    def __init__(self, langs=None, prefix_file=None, more=True, keep_newlines=True):
+    #: the available engines, see :py:meth:`split_paragraph` and :py:meth:`scan_paragraph`
+    engines = ('regex', 'scan')
+
+    def __init__(self, langs=None, prefix_file=None, more=True, keep_newlines=True, engine='regex', cache_size=0):
         """
         :param lang: a List[str] of language(s) for nonbreaking_prefix file to load (default: en, de)
         :param prefix_file: path to a custom nonbreaking_prefix file
@@ -59,29 +93,98 @@ class MocySplitter(ISplitter):
         :param keep_newlines: if set, treat newlines as paragraph delimiters that will be preserved.
             If unset, newlines are ignored and empty lines are treated as paragraph delimiters
             (Moses original behavior, see :py:meth:`split`).
+        :param engine: how to split paragraphs, either ``regex`` (:py:meth:`split_paragraph`) or ``scan``
+            (:py:meth:`scan_paragraph`, faster). Both give the same results.
+        :param cache_size: if set, keep the sentences of up to this many paragraphs in a :py:class:`ParagraphCache`,
+            so paragraphs repeated across pages (menus, footers, etc.) are only split once. It is cleared when
+            :py:attr:`nb_prefixes` is replaced, but not if you modify it in place
 
         """
+        if engine not in self.engines:
+            raise ValueError(f'Unknown engine {engine}, should be one of {", ".join(self.engines)}.')
+        self.engine = engine  #: the engine used to split paragraphs
+        #: the cache of split paragraphs, if enabled
+        self.cache = ParagraphCache(cache_size) if cache_size > 0 else None
         self.langs = langs if langs is not None else ['en', 'de']  #: nonbreaking prefixes files to load
         self.more = more  #: whether or not to split on ``:;``
-        self.nb_prefixes = self.load_nb_prefixes(self.langs, prefix_file)  #: nonbreaking prefix lookup table
+        self.nb_prefixes = self.load_nb_prefixes(self.langs, prefix_file)
         self.keep_newlines = keep_newlines
         # TODO: keep_newlines seems better with Justext, but http://www.raere-waggis.ch/p300fasnacht2007.htm
         # things like songs etc ...
 
-    def split(self, input_text, more=None, keep_newlines=None):  # -> List[str]
+    @property
+    def nb_prefixes(self):  # -> Dict
+        """Nonbreaking prefix lookup table."""
+        return self._nb_prefixes
+
+    @nb_prefixes.setter
+    def nb_prefixes(self, nb_prefixes):
+        self._nb_prefixes = nb_prefixes
+        if self.cache is not None:
+            self.cache.clear()  # the paragraphs split so far may be split differently
+
+    def split(self, input_text, more=None, keep_newlines=None, workers=1):  # -> List[str]
         """
         Split a text into sentences. Depending on the value of :py:attr:`.keep_newlines`, either :py:meth:`split_sentences`
         or :py:meth:`split_text` will be called.
 
+        Paragraphs are split independently, so huge texts (e.g. a book or a dump) can be split in parallel:
+        if ``workers`` is not 1, the text is cut into blocks of whole paragraphs, which are split by a pool of
+        processes. The result is the same.
+
         :param input_text: the input text
         :param more: override the class' parameter
         :param keep_newlines: override the class' parameter
+        :param workers: the number of processes to use, None for the number of CPUs. Default to one (no pool)
         :return: a list of sentences (no blank lines)
         """
         more = more if more is not None else self.more
         keep_newlines = keep_newlines if keep_newlines is not None else self.keep_newlines
+        if workers != 1:
+            return self._split_parallel(input_text, more, keep_newlines, workers or os.cpu_count())
         return self._split_sentences(input_text, more) if keep_newlines else self._split_text(input_text, more)
 
+    def _split_parallel(self, input_text, more, keep_newlines, workers):  # -> List[str]
+        # Split the text in a pool of processes, about four blocks of paragraphs per worker.
+        # Each worker gets its own copy of this splitter when it starts
+        blocks = _paragraph_blocks(input_text, keep_newlines, len(input_text) // (workers * 4) + 1)
+        with worker_pool(workers, self) as pool:
+            results = pool.imap(in_worker('split', more=more, keep_newlines=keep_newlines), blocks)
+            return [sentence for sentences in results for sentence in sentences]
+
+    def split_spans(self, input_text, more=None, keep_newlines=None):  # -> List[Tuple[int, int]]
+        """
+        Split a text into sentences like :py:meth:`split`, but return the ``(start, end)`` offsets of each sentence
+        in ``input_text`` instead of a copy. The slice ``input_text[start:end]`` is the sentence returned by
+        :py:meth:`split`, except for the whitespace normalized by the latter (multiple spaces collapsed into one and,
+        if :py:attr:`keep_newlines` is unset, newlines inside a paragraph replaced by spaces).
+
+        :param input_text: the input text
+        :param more: override the class' parameter
+        :param keep_newlines: override the class' parameter
+        :return: a list of ``(start, end)`` tuples, in order
+        """
+        return _find_spans(input_text, self.split(input_text, more, keep_newlines))
+
+    def iter_split(self, text_or_lines, more=None, keep_newlines=None):  # -> Iterator[str]
+        """
+        Lazily split a text into sentences, like :py:meth:`split`. The input can also be an iterable of lines
+        (e.g. an open file), in which case the sentences of each paragraph are yielded as soon as the paragraph
+        is complete, that is at the end of each line if :py:attr:`.keep_newlines` is set, else at each empty line.
+        The memory used is thus bounded by the size of the longest paragraph.
+
+        :param text_or_lines: the input text, or an iterable of lines (with or without trailing newlines)
+        :param more: override the class' parameter
+        :param keep_newlines: override the class' parameter
+        :return: a generator of sentences (no blank lines)
+        """
+        more = more if more is not None else self.more
+        keep_newlines = keep_newlines if keep_newlines is not None else self.keep_newlines
+        lines = text_or_lines.split('\n') if isinstance(text_or_lines, str) else iter_lines(text_or_lines)
+        paragraphs = _line_paragraphs(lines) if keep_newlines else _text_paragraphs(lines)
+        for paragraph in paragraphs:
+            yield from self._split_paragraph(paragraph, more)
+
     def _split_sentences(self, input_text, more):  # -> List[str]
         """
         Split a text into sentences. Newlines already present in text will be preserved and act as paragraph delimiters.
@@ -90,11 +193,11 @@ class MocySplitter(ISplitter):
         :param more: split on :; if true
         :return: a list of sentences (no blank lines)
         """
-        return sum((
-            self.split_paragraph(p, self.nb_prefixes, more)
-            for p in input_text.split('\n')
-            if p and not p.isspace()
-        ), [])
+        return [
+            sentence
+            for p in _line_paragraphs(input_text.split('\n'))
+            for sentence in self._split_paragraph(p, more)
+        ]
 
     def _split_text(self, input_text, more):  # -> List[str]
         """
@@ -105,30 +208,34 @@ class MocySplitter(ISplitter):
         :return: a list of sentences (no blank lines)
         """
         # equivalent of process_text in moses, but returns a list
-        current_paragraph = ''
-        splits = []
-        for line in input_text.split('\n'):
-            if not line or line.isspace():
-                # Time to process this block; we've hit a blank or <p>
-                if current_paragraph:
-                    splits.extend(self.split_paragraph(current_paragraph, self.nb_prefixes, more))
-                    current_paragraph = ""
-            else:
-                current_paragraph += line + ' '
-
-        if current_paragraph:
-            # Do the leftover text.
-            splits.extend(self.split_paragraph(current_paragraph, self.nb_prefixes, more))
-
-        return splits
+        return [
+            sentence
+            for p in _text_paragraphs(input_text.split('\n'))
+            for sentence in self._split_paragraph(p, more)
+        ]
+
+    def _split_paragraph(self, text, more):  # -> Sequence[str]
+        # split one paragraph using the selected engine and the cache, if any
+        if self.cache is not None:
+            key = (text, more)
+            sentences = self.cache.get(key)
+            if sentences is None:
+                sentences = tuple(self._split_paragraph_with_engine(text, more))
+                self.cache.put(key, sentences)
+            return sentences
+        return self._split_paragraph_with_engine(text, more)
+
+    def _split_paragraph_with_engine(self, text, more):  # -> List[str]
+        if self.engine == 'scan':
+            return self.scan_paragraph(text, self.nb_prefixes, more)
+        return self.split_paragraph(text, self.nb_prefixes, more)
 
     @classmethod
     def cleanup_spaces(cls, text):  # -> str
         """Normalize spaces in a text."""
-        # clean up spaces
-        text = re.sub(' +', ' ', text)
-        text = re.sub('\n ', '\n', text)
-        text = re.sub(' \n ', '\n', text)
+        # clean up spaces: once spaces are collapsed, a ' \n ' can't remain after removing the '\n '
+        text = _multi_spaces_pattern.sub(' ', text)
+        text = text.replace('\n ', '\n')
         return text.strip()
 
     @classmethod
@@ -153,62 +260,167 @@ class MocySplitter(ISplitter):
             # https://bitbucket.org/luismsgomes/mosestokenizer/src/default/src/mosestokenizer/split-sentences.perl
             # text = regex.sub(r'([\:;])', r'\1\n', text)
             # TODO: improvement: try to keep emojis, numers like 1:1 and urls intact
-            text = regex.sub(r'([\:;])([^\d\)\(/-])', r'\1\n\2', text)
+            text = _more_pattern.sub(r'\1\n\2', text)
 
         # split if ?! is followed by a lowercase (often on the web)
-        text = regex.sub(r'([\?!]+)([^\?!\p{Pe}\p{Pf}\"])', r'\1\n\2', text)
+        text = _question_pattern.sub(r'\1\n\2', text)
         # text = regex.sub(r'([?!]) +([\'\"\(\[\¿\¡\p{Pi}]*[\p{L}])', r'\1\n\2', text)
 
         # Multi-dots followed by sentence starters.
-        text = regex.sub(r'(\.[\.]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\p{L}])', r'\1\n\2', text)
+        text = _multi_dots_pattern.sub(r'\1\n\2', text)
 
         # Add breaks for sentences that end with some sort of punctuation
         # inside a quote or parenthetical and are followed by a possible
         # sentence starter punctuation and ~upper case~ letter
-        text = regex.sub(r'([?!\.][\ ]*[\'\"\)\]\p{Pf}]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\ ]*[\p{Lu}])', r'\1\n\2', text)
+        text = _quoted_end_pattern.sub(r'\1\n\2', text)
 
         # Add breaks for sentences that end with some sort of punctuation,
         # and are followed by a sentence starter punctuation and upper case letter.
-        text = regex.sub(r'([?!\.]) +([\'\"\(\[\¿\¡\p{Pi}]+[\ ]*[\p{L}])', r'\1\n\2', text)
+        text = _punct_end_pattern.sub(r'\1\n\2', text)
 
         # Special punctuation cases are covered. Check all remaining periods.
+        # Only words ending with a period (maybe followed by a newline added above) can match (\.+)$
         words = text.split(' ')
-        text = ''
         for i in range(len(words) - 1):
+            word = words[i]
+            if not (word.endswith('.') or word.endswith('.\n')):
+                continue
             # TODO: add the # as a possible sentence start ? (twitter and hashtags)
-            m = regex.search(r'([\p{IsAlnum}\.\-]*)([\'\"\)\]\%\p{Pf}]*)(\.+)$', words[i])
+            m = _period_word_pattern.search(word)
             if m is not None:
                 # Check if $1 is a known honorific and $2 is empty, never break.
                 prefix, starting_punct, _ = m.groups()
                 if prefix and nb_prefixes.get(prefix, _UNDEF) == _ANY and not starting_punct:
                     pass  # Not breaking prefix
-                elif regex.search(r'(\.)[\p{IsUpper}\-]+(\.+)$', words[i]) is not None:
+                elif _acronym_pattern.search(word) is not None:
                     pass  # Not breaking - upper case acronym
-                elif regex.search(r'^([ ]*[\'\"\(\[\¿\¡\p{Pi}]*[ ]*[\p{L}0-9])', words[i + 1]):
+                elif _sentence_start_pattern.match(words[i + 1]):
                     # The next word has maybe a bunch of initial quotes, maybe a
                     # space, then either ~upper case~ letter or a number
                     if prefix and nb_prefixes.get(prefix, _UNDEF) == _NUMERIC_ONLY and not starting_punct \
-                            and regex.search('^[0-9]+', words[i + 1]):
+                            and _number_start_pattern.match(words[i + 1]):
                         # exception: we have a numeric-only prefix followed by a number
                         pass
                     else:
                         # In any other case, split
-                        words[i] = words[i] + '\n'
-            text += words[i] + ' '
+                        words[i] = word + '\n'
 
-        # We stopped one token from the end to allow for easy look-ahead.
-        # Append it now.
-        text = text + words[-1]
+        # join all the words at once (instead of concatenating in the loop, which is quadratic on long paragraphs)
+        text = ' '.join(words)
 
         # clean up spaces
         text = cls.cleanup_spaces(text)
 
         return text.split('\n')
 
+    @classmethod
+    def scan_paragraph(cls, text, nb_prefixes, more=False):  # -> List[str]
+        """
+        Handle one paragraph of text, giving the exact same results as :py:meth:`split_paragraph`.
+        Instead of applying each substitution to the whole paragraph in turn, the candidate boundaries are found in
+        one single scan, and each candidate is decided by looking at its surroundings (including the decisions
+        the previous substitutions would have taken). Sentences are then sliced from the cleaned text.
+
+        :param text: the paragraph to split
+        :param nb_prefixes: the dictionary of nonbreaking_prefix (see perl implementation/doc)
+        :param more: if set, systematically split on :;
+        :return: a list of sentences
+        """
+        if not text:
+            return ''
+        text = cls.cleanup_spaces(text)
+        if '\n' in text:
+            # the decisions below assume the paragraph is on one line
+            return cls.split_paragraph(text, nb_prefixes, more)
+
+        length = len(text)
+        cuts = []  # (end of sentence, start of next sentence)
+
+        for m in _candidates_pattern.finditer(text):
+            start, end = m.span()
+            c = text[start]
+
+            if c == ':' or c == ';':
+                # more: split after every other :; of the run, the last one only if followed by a "valid" char
+                if not more:
+                    continue
+                for i in range(start, end, 2):
+                    if i + 1 < end or (end < length and _more_next_pattern.match(text, end)):
+                        cuts.append((i + 1, i + 2 if text[i + 1] == ' ' else i + 1))
+
+            elif c == '?' or c == '!':
+                # split if ?! is followed by anything but more ?! or closing punctuation
+                if end < length and _question_next_pattern.match(text, end):
+                    cuts.append((end, end + 1 if text[end] == ' ' else end))
+
+            elif text[start - 1] != '.':
+                # space after closing quotes: split if the closing quotes follow some sort of punctuation
+                # (maybe with a space) and precede a possible sentence starter punctuation and upper case letter
+                i = start - 1
+                while i > 0 and _closer_pattern.match(text, i - 1):
+                    i -= 1
+                if i > 1 and text[i - 1] == ' ':
+                    i -= 1
+                if i > 0 and text[i - 1] in '?!.' and _quoted_end_next_pattern.match(text, end):
+                    # ?! directly followed by a space or an apostrophe were already split
+                    if text[i - 1] == '.' or not _question_next_pattern.match(text, i):
+                        cuts.append((start, end))
+
+            elif start > 1 and text[start - 2] == '.' and _multi_dots_next_pattern.match(text, end):
+                # multi-dots followed by sentence starters
+                cuts.append((start, end))
+
+            elif text[end].isalnum():
+                # period followed by a space and a word (the most common case)
+                if cls._is_period_break(text, start, nb_prefixes):
+                    cuts.append((start, end))
+
+            else:
+                # period followed by a space and some punctuation. If the space is followed by closing quotes ending
+                # a sentence, the break happens after them (see above) and this space is left for the period check
+                closers = _closers_pattern.match(text, end)
+                if (closers is None or not _quoted_end_next_pattern.match(text, closers.end())) \
+                        and _punct_end_next_pattern.match(text, end):
+                    # followed by a sentence starter punctuation and a letter
+                    cuts.append((start, end))
+                elif cls._is_period_break(text, start, nb_prefixes):
+                    cuts.append((start, end))
+
+        sentences, previous = [], 0
+        for stop, next_start in cuts:
+            sentences.append(text[previous:stop])
+            previous = next_start
+        sentences.append(text[previous:])
+        return sentences
+
+    @staticmethod
+    def _is_period_break(text, space, nb_prefixes):
+        # Decide if the space following a word ending with a period is a sentence break (see split_paragraph)
+        word = text[text.rfind(' ', 0, space) + 1:space]
+        m = _period_word_pattern.search(word)
+        if m is None:
+            return False
+        # Check if $1 is a known honorific and $2 is empty, never break.
+        prefix, starting_punct, _ = m.groups()
+        if prefix and nb_prefixes.get(prefix, _UNDEF) == _ANY and not starting_punct:
+            return False  # Not breaking prefix
+        if _acronym_pattern.search(word) is not None:
+            return False  # Not breaking - upper case acronym
+        # The next word (up to the next space) has maybe a bunch of initial quotes, maybe a
+        # space, then either ~upper case~ letter or a number
+        next_space = text.find(' ', space + 1)
+        if _sentence_start_pattern.match(text, space + 1, next_space if next_space >= 0 else len(text)):
+            # exception: we have a numeric-only prefix followed by a number
+            return not (prefix and nb_prefixes.get(prefix, _UNDEF) == _NUMERIC_ONLY and not starting_punct
+                        and _number_start_pattern.match(text, space + 1))
+        return False
+
     @classmethod
     def load_nb_prefixes(cls, langs, prefix_file=None):  # -> Dict
         """
         Read the nonbreaking_prefixes from a file or from an array of languages.
+        Tables are cached for the whole process (and invalidated if a file changes), so creating many splitters
+        only reads the files once. Each call returns a copy, that can be modified freely.
 
         :param langs: the language(s) to load
         :param prefix_file: a custom file to load (has priority over lang)
@@ -217,20 +429,28 @@ class MocySplitter(ISplitter):
         """
         if prefix_file is not None:
             print(f'Using custom prefix file: {prefix_file}', file=sys.stderr)
-            return cls._read_prefix_file(prefix_file)
-
-        this_dir = os.path.dirname(os.path.realpath(__file__))
-        prefix_file_pattern = os.path.join(this_dir, 'moses_splitter_prefixes.{}.txt')
-
-        prefixes = dict()
-        for lang in langs:
-            prefix_file = prefix_file_pattern.format(lang)
-            if not os.path.isfile(prefix_file):
-                logger.warning(f'No known abbreviations for language {lang}, skipping...')
-                continue
-            prefixes.update(**cls._read_prefix_file(prefix_file))
-            logger.info(f'Loaded prefix file for lang={lang} (prefix size: {len(prefixes)}).')
-        return prefixes
+            prefix_files = [(None, prefix_file)]
+        else:
+            this_dir = os.path.dirname(os.path.realpath(__file__))
+            prefix_file_pattern = os.path.join(this_dir, 'moses_splitter_prefixes.{}.txt')
+            prefix_files = []
+            for lang in langs:
+                prefix_file = prefix_file_pattern.format(lang)
+                if not os.path.isfile(prefix_file):
+                    logger.warning(f'No known abbreviations for language {lang}, skipping...')
+                    continue
+                prefix_files.append((lang, prefix_file))
+
+        key = tuple((path, os.stat(path).st_mtime_ns) for _, path in prefix_files)
+        prefixes = _nb_prefixes_cache.get(key)
+        if prefixes is None:
+            table = dict()
+            for lang, path in prefix_files:
+                table.update(**cls._read_prefix_file(path))
+                if lang is not None:
+                    logger.info(f'Loaded prefix file for lang={lang} (prefix size: {len(table)}).')
+            prefixes = _nb_prefixes_cache[key] = table
+        return dict(prefixes)
 
     @staticmethod
     def _read_prefix_file(filename):  # -> Dict
@@ -248,6 +468,96 @@ class MocySplitter(ISplitter):
         return prefixes
 
 
+class ParagraphCache(LRUCache):
+    """
+    A :py:class:`~phrasal.utils.LRUCache` of split paragraphs, keyed by ``(paragraph, more, prefixes id)`` and
+    bounded by the number of entries.
+    """
+
+    def __init__(self, max_entries=100_000):
+        super().__init__(max_entries)
+
+
+#: process-wide cache of the nonbreaking prefix tables, key=((path, mtime), ...) of the files loaded
+_nb_prefixes_cache = dict()
+
+
+def _line_paragraphs(lines):
+    # each (non-blank) line is a paragraph
+    return (line for line in lines if line and not line.isspace())
+
+
+def _text_paragraphs(lines):
+    # paragraphs are delimited by blank lines, lines of a paragraph are joined with spaces
+    current_paragraph = []  # the lines of the current paragraph
+    for line in lines:
+        if not line or line.isspace():
+            # Time to process this block; we've hit a blank or <p>
+            if current_paragraph:
+                yield ' '.join(current_paragraph) + ' '
+                current_paragraph = []
+        else:
+            current_paragraph.append(line)
+
+    if current_paragraph:
+        # Do the leftover text.
+        yield ' '.join(current_paragraph) + ' '
+
+
+def _paragraph_blocks(text, keep_newlines, size):
+    # Cut the text into blocks of about size characters, on paragraph boundaries: newlines if keep_newlines is set,
+    # else blank lines. Each block ends with a newline (but the last), so splitting the blocks gives the same
+    # sentences as splitting the whole text
+    blocks, start = [], 0
+    while len(text) - start > size:
+        if keep_newlines:
+            cut = text.find('\n', start + size) + 1
+        else:
+            m = _blank_line_pattern.search(text, start + size)
+            cut = m.start() + 1 if m is not None else 0
+        if cut == 0:
+            break
+        blocks.append(text[start:cut])
+        start = cut
+    blocks.append(text[start:])
+    return blocks
+
+
+def _find_spans(text, sentences):
+    # Find the position of each sentence in the original text. The sentences appear in order, and only differ from
+    # the text by some whitespace: stripped, multiple spaces collapsed or newlines replaced by spaces
+    spans, pos = [], 0
+    for sentence in sentences:
+        start = pos
+        if not text.startswith(sentence, start):
+            start = _whitespace_pattern.match(text, pos).end()
+        if text.startswith(sentence, start):
+            end = start + len(sentence)
+        else:
+            start, end = _align(text, sentence, pos)
+        spans.append((start, end))
+        pos = end
+    return spans
+
+
+def _align(text, sentence, pos):
+    # Match the sentence against the text starting at pos, skipping extra whitespace. Return its (start, end)
+    start = None
+    i = 0
+    while i < len(sentence):
+        if pos >= len(text):
+            raise ValueError(f'Could not find sentence {sentence!r} in the text.')
+        c, o = sentence[i], text[pos]
+        if c == o or (c == ' ' and o == '\n'):
+            if start is None:
+                start = pos
+            i += 1
+        elif not o.isspace():
+            raise ValueError(f'Could not find sentence {sentence!r} in the text.')
+        pos += 1
+    return start if start is not None else pos, pos
+
+
 def main():
     import argparse
 
@@ -257,6 +567,9 @@ def main():
     parser.add_argument('-l', '--lang', action='append')
     parser.add_argument('-pf', '--prefix-file', default=None)
     parser.add_argument('-m', '--more', default=False, action='store_true')
+    parser.add_argument('-e', '--engine', choices=MocySplitter.engines, default='regex')
+    parser.add_argument('-s', '--stream', default=False, action='store_true',
+                        help='read the input line by line and write sentences as soon as each paragraph is split')
 
     args = parser.parse_args()
 
@@ -265,8 +578,13 @@ def main():
     splitter = MocySplitter(
         langs=args.lang,
         prefix_file=args.prefix_file,
-        more=args.more)
-
-    args.out.write('\n'.join(
-        splitter.split(args.input.read())
-    ))
+        more=args.more,
+        engine=args.engine)
+
+    if args.stream:
+        for i, sentence in enumerate(splitter.iter_split(args.input)):
+            args.out.write(sentence if i == 0 else '\n' + sentence)
+    else:
+        args.out.write('\n'.join(
+            splitter.split(args.input.read())
+        ))
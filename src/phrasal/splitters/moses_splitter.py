@@ -21,15 +21,28 @@ Changed compared to the latest split-sentences.perl:
 import os
 import re
 import sys
-import regex
 
 from ..interfaces import ISplitter
+from ..regex_utils import compile_pattern
+from ..utils import iter_lines
 
 
 # Perl Regex substitutions:
 # * \p{IsPi} => \p{Pi} or \p{Initial_Punctuation}: any kind of opening quote.
 # * \p{IsPf} => \p{Pf} or \p{Final_Punctuation}: any kind of closing quote.
 
+# Patterns used by split_paragraph, compiled once (see the method for details)
+_multi_spaces_pattern = re.compile(' {2,}')
+_more_pattern = compile_pattern(r'([\:;])')
+_question_pattern = compile_pattern(r'([?!]) +([\'\"\(\[\¿\¡\p{Pi}]*[\p{IsUpper}])')
+_multi_dots_pattern = compile_pattern(r'(\.[\.]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\p{IsUpper}])')
+_quoted_end_pattern = compile_pattern(r'([?!\.][\ ]*[\'\"\)\]\p{Pf}]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\ ]*[\p{IsUpper}])')
+_punct_end_pattern = compile_pattern(r'([?!\.]) +([\'\"\(\[\¿\¡\p{Pi}]+[\ ]*[\p{IsUpper}])')
+_period_word_pattern = compile_pattern(r'([\p{IsAlnum}\.\-]*)([\'\"\)\]\%\p{Pf}]*)(\.+)$')
+_acronym_pattern = compile_pattern(r'(\.)[\p{IsUpper}\-]+(\.+)$')
+_sentence_start_pattern = compile_pattern(r'([ ]*[\'\"\(\[\¿\¡\p{Pi}]*[ ]*[\p{IsUpper}0-9])')
+_number_start_pattern = compile_pattern('[0-9]+')
+
 
 class MosesSplitter(ISplitter):
     """Python implementation of Moses' split_sentences.perl"""
@@ -46,25 +59,36 @@ class MosesSplitter(ISplitter):
 
     def split(self, input_text):  # -> List[str]
         # equivalent of process_text in moses, but returns a list
-        current_paragraph = ''
-        splits = []
-        for line in input_text.split('\n'):
+        return list(self.iter_split(input_text))
+
+    def iter_split(self, text_or_lines):  # -> Iterator[str]
+        """
+        Lazily split a text into sentences, like :py:meth:`split`. The input can also be an iterable of lines
+        (e.g. an open file), in which case the sentences of each paragraph are yielded as soon as the paragraph
+        is closed by an empty line (or a markup line). The memory used is thus bounded by the size of the longest
+        paragraph.
+
+        :param text_or_lines: the input text, or an iterable of lines (with or without trailing newlines)
+        :return: a generator of sentences
+        """
+        lines = text_or_lines.split('\n') if isinstance(text_or_lines, str) else iter_lines(text_or_lines)
+
+        current_paragraph = []  # the lines of the current paragraph
+        for line in lines:
             if not line or line.isspace() or (line.startswith('<') and line.endswith('>')):
                 # Time to process this block; we've hit a blank or <p>
                 if current_paragraph:
-                    splits.extend(self._do_it_for(current_paragraph, line))
+                    yield from self._do_it_for(' '.join(current_paragraph) + ' ', line)
                     # don't happend '<P>' on empty lines
                     # if not len(line) or line.isspace() and current_paragraph:
                     #     splits.append('<P>')  ## If we have text followed by <P>
-                    current_paragraph = ""
+                    current_paragraph = []
             else:
-                current_paragraph += line + ' '
+                current_paragraph.append(line)
 
         if current_paragraph:
             # Do the leftover text.
-            splits.extend(self._do_it_for(current_paragraph))
-
-        return splits
+            yield from self._do_it_for(' '.join(current_paragraph) + ' ')
 
     def _do_it_for(self, input_text, markup=''):
         # process one paragraph
@@ -78,10 +102,9 @@ class MosesSplitter(ISplitter):
     @classmethod
     def cleanup_spaces(cls, text):
         """Normalize spaces in a text."""
-        # clean up spaces
-        text = re.sub(' +', ' ', text)
-        text = re.sub('\n ', '\n', text)
-        text = re.sub(' \n ', '\n', text)
+        # clean up spaces: once spaces are collapsed, a ' \n ' can't remain after removing the '\n '
+        text = _multi_spaces_pattern.sub(' ', text)
+        text = text.replace('\n ', '\n')
         return text.strip()
 
     @classmethod
@@ -103,48 +126,49 @@ class MosesSplitter(ISplitter):
         if more:
             # this one is present in the python wrapper, see
             # https://bitbucket.org/luismsgomes/mosestokenizer/src/default/src/mosestokenizer/split-sentences.perl
-            text = regex.sub(r'([\:;])', r'\1\n', text)
+            text = _more_pattern.sub(r'\1\n', text)
 
         # Non-period end of sentence markers (?!) followed by sentence starters.
-        text = regex.sub(r'([?!]) +([\'\"\(\[\¿\¡\p{Pi}]*[\p{IsUpper}])', r'\1\n\2', text)
+        text = _question_pattern.sub(r'\1\n\2', text)
 
         # Multi-dots followed by sentence starters.
-        text = regex.sub(r'(\.[\.]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\p{IsUpper}])', r'\1\n\2', text)
+        text = _multi_dots_pattern.sub(r'\1\n\2', text)
 
         # Add breaks for sentences that end with some sort of punctuation
         # inside a quote or parenthetical and are followed by a possible
         # sentence starter punctuation and upper case.
-        text = regex.sub(r'([?!\.][\ ]*[\'\"\)\]\p{Pf}]+) +([\'\"\(\[\¿\¡\p{Pi}]*[\ ]*[\p{IsUpper}])', r'\1\n\2', text)
+        text = _quoted_end_pattern.sub(r'\1\n\2', text)
 
         # Add breaks for sentences that end with some sort of punctuation,
         # and are followed by a sentence starter punctuation and upper case.
-        text = regex.sub(r'([?!\.]) +([\'\"\(\[\¿\¡\p{Pi}]+[\ ]*[\p{IsUpper}])', r'\1\n\2', text)
+        text = _punct_end_pattern.sub(r'\1\n\2', text)
 
         # Special punctuation cases are covered. Check all remaining periods.
+        # Only words ending with a period (maybe followed by a newline added above) can match (\.+)$
         words = text.split(' ')
-        text = ''
         for i in range(len(words) - 1):
-            m = regex.search(r'([\p{IsAlnum}\.\-]*)([\'\"\)\]\%\p{Pf}]*)(\.+)$', words[i])
+            word = words[i]
+            if not (word.endswith('.') or word.endswith('.\n')):
+                continue
+            m = _period_word_pattern.search(word)
             if m is not None:
                 # Check if $1 is a known honorific and $2 is empty, never break.
                 prefix, starting_punct, _ = m.groups()
                 if prefix and nb_prefixes.get(prefix, -1) == 1 and not starting_punct:
                     pass  # Not breaking;
-                elif regex.search(r'(\.)[\p{IsUpper}\-]+(\.+)$', words[i]) is not None:
+                elif _acronym_pattern.search(word) is not None:
                     pass  # Not breaking - upper case acronym
-                elif regex.search(r'^([ ]*[\'\"\(\[\¿\¡\p{Pi}]*[ ]*[\p{IsUpper}0-9])', words[i + 1]):
+                elif _sentence_start_pattern.match(words[i + 1]):
                     # The next word has a bunch of initial quotes, maybe a
                     # space, then either upper case or a number
                     if not (prefix and nb_prefixes.get(prefix, -1) == 2 and not starting_punct
-                            and regex.search('^[0-9]+', words[i + 1])):
+                            and _number_start_pattern.match(words[i + 1])):
                         # We always add a return for these, unless we have a
                         # numeric non-breaker and a number start.
-                        words[i] = words[i] + '\n'
-            text += words[i] + ' '
+                        words[i] = word + '\n'
 
-        # We stopped one token from the end to allow for easy look-ahead.
-        # Append it now.
-        text = text + words[-1]
+        # join all the words at once (instead of concatenating in the loop, which is quadratic on long paragraphs)
+        text = ' '.join(words)
 
         # clean up spaces
         text = cls.cleanup_spaces(text)
@@ -154,7 +178,9 @@ class MosesSplitter(ISplitter):
     @classmethod
     def load_nb_prefixes(cls, lang='en', prefix_file=None):
         """
-        Read the nonbreaking_prefixes from a file
+        Read the nonbreaking_prefixes from a file. Tables are cached for the whole process (and invalidated if
+        the file changes), so creating many splitters only reads the file once. Each call returns a copy, that can
+        be modified freely.
 
         :param lang: the language to load
         :param prefix_file: a custom file to load (has priority over lang)
@@ -162,8 +188,8 @@ class MosesSplitter(ISplitter):
                  1 means apply anywhere, 2 means only applies when followed by digits.
         """
         if prefix_file is None:
-            this_file = os.path.realpath(__file__)
-            prefix_file = this_file.replace('_orig.py', f'_prefixes.{lang}.txt')  # TODO
+            this_dir = os.path.dirname(os.path.realpath(__file__))
+            prefix_file = os.path.join(this_dir, f'moses_splitter_prefixes.{lang}.txt')
 
             if not os.path.isfile(prefix_file):
                 print(
@@ -173,6 +199,11 @@ class MosesSplitter(ISplitter):
         else:
             print(f'Using custom prefix file: {prefix_file}', file=sys.stderr)
 
+        key = (prefix_file, os.stat(prefix_file).st_mtime_ns)
+        prefixes = _nb_prefixes_cache.get(key)
+        if prefixes is not None:
+            return dict(prefixes)
+
         prefixes = dict()
         with open(prefix_file) as f:
             for line in f:
@@ -184,7 +215,12 @@ class MosesSplitter(ISplitter):
                     prefixes[line.replace('#NUMERIC_ONLY#', '').strip()] = 2
                 else:
                     prefixes[line] = 1
-        return prefixes
+        _nb_prefixes_cache[key] = prefixes
+        return dict(prefixes)
+
+
+#: process-wide cache of the nonbreaking prefix tables, key=(path, mtime)
+_nb_prefixes_cache = dict()
 
 
 def main():
@@ -196,6 +232,8 @@ def main():
     parser.add_argument('-l', '--lang', default='de')
     parser.add_argument('-pf', '--prefix-file', default=None)
     parser.add_argument('-m', '--more', default=False, action='store_true')
+    parser.add_argument('-s', '--stream', default=False, action='store_true',
+                        help='read the input line by line and write sentences as soon as each paragraph is split')
 
     args = parser.parse_args()
     splitter = MosesSplitter(
@@ -203,6 +241,10 @@ def main():
         prefix_file=args.prefix_file,
         more=args.more)
 
-    args.out.write('\n'.join(
-        splitter.split(args.input.read())
-    ))
+    if args.stream:
+        for i, sentence in enumerate(splitter.iter_split(args.input)):
+            args.out.write(sentence if i == 0 else '\n' + sentence)
+    else:
+        args.out.write('\n'.join(
+            splitter.split(args.input.read())
+        ))
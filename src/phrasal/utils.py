@@ -0,0 +1,116 @@
+"""
+Helpers shared by the normalizer and the splitters: a LRU cache for repeated inputs, lazy line iteration and
+process pools whose workers hold a copy of a normalizer or splitter.
+"""
+
+import functools
+import multiprocessing
+import sys
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A LRU cache, bounded by the number of entries and, optionally, their size in bytes (see :py:meth:`sizeof`).
+    Hits and misses are counted, for monitoring.
+
+    Note that the entries are not pickled: a copy (e.g. in a worker process) starts empty.
+    """
+
+    def __init__(self, max_entries=100_000, max_bytes=None):
+        self.max_entries = max_entries  #: maximum number of entries
+        self.max_bytes = max_bytes  #: maximum size of the entries, in bytes (None for no limit)
+        self.entries = OrderedDict()  # key => (value, size)
+        self.bytes = 0  #: current size of the entries, in bytes (if bounded)
+        self.hits = 0  #: number of lookups that found an entry
+        self.misses = 0  #: number of lookups that didn't
+
+    def sizeof(self, key, value):
+        """The size of an entry, in bytes (only used if :py:attr:`max_bytes` is set)."""
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def get(self, key):
+        """Get the value of a key, or ``None`` if not in the cache."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """Add an entry, evicting the least recently used ones if needed."""
+        size = 0
+        if self.max_bytes is not None:
+            size = self.sizeof(key, value)
+            if size > self.max_bytes:
+                return
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        self.entries.clear()
+        self.bytes = self.hits = self.misses = 0
+
+    def stats(self):
+        """Get the counters, as a dictionary."""
+        lookups = self.hits + self.misses
+        stats = dict(hits=self.hits, misses=self.misses, hit_rate=self.hits / lookups if lookups else 0,
+                     entries=len(self.entries))
+        if self.max_bytes is not None:
+            stats['bytes'] = self.bytes
+        return stats
+
+    def __getstate__(self):
+        return dict(max_entries=self.max_entries, max_bytes=self.max_bytes)
+
+    def __setstate__(self, state):
+        LRUCache.__init__(self, **state)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def iter_lines(lines):
+    """
+    Iterate over lines, stripping the trailing newline (e.g. when reading a file) and splitting multi-line elements.
+    """
+    for line in lines:
+        yield from (line[:-1] if line.endswith('\n') else line).split('\n')
+
+
+def worker_pool(processes, instance):
+    """
+    Create a :py:class:`multiprocessing.Pool` whose workers each get a copy of ``instance`` when they start.
+    Use :py:func:`in_worker` to call its methods.
+
+    :param processes: the number of processes, None for the number of CPUs
+    :param instance: a picklable object, e.g. a normalizer or a splitter
+    """
+    return multiprocessing.Pool(processes, initializer=_init_worker, initargs=(instance,))
+
+
+def in_worker(method, **kwargs):
+    """
+    Return a picklable function calling ``method`` on the copy of the instance held by the worker
+    (see :py:func:`worker_pool`), with one positional argument and the given keyword arguments.
+    It can be passed to ``pool.imap`` and the like.
+    """
+    return functools.partial(_call_in_worker, method, kwargs)
+
+
+_worker_instance = None  # the instance of the current worker process, see worker_pool
+
+
+def _init_worker(instance):
+    global _worker_instance
+    _worker_instance = instance
+
+
+def _call_in_worker(method, kwargs, arg):
+    return getattr(_worker_instance, method)(arg, **kwargs)
@@ -0,0 +1,127 @@
+import pytest
+
+from phrasal import PatternSentenceFilter
+
+np = pytest.importorskip('numpy')
+
+from phrasal.filterers.incremental_filter import IncrementalFilter, RuleOutcomes
+
+RULES = '''
+- too_short:
+  descr: too short
+  length:
+    min: 3
+
+- lowercase:
+  descr: only lowercase letters and spaces
+  find:
+    pattern: '[^a-z ]'
+    count:
+      max: 0
+
+- spaces:
+  descr: space ratio
+  compare:
+    num: ' '
+    denom: '[^ ]'
+    ratio:
+      min: 0.5
+'''
+
+SENTENCES = ['a a b b', 'a ', 'a', 'A a b b', 'aabb', '', 'ab cd ef', 'x y z', 'hello world', 'yes no'] * 5
+
+
+def refilter(tmp_path, rules, previous=None, sentences=SENTENCES):
+    rulespath = tmp_path / 'rules.yaml'
+    rulespath.write_text(rules)
+    return IncrementalFilter(str(rulespath), chunk_size=12).refilter(sentences, previous)
+
+
+def expected_changes(tmp_path, old_rules, new_rules):
+    (tmp_path / 'old.yaml').write_text(old_rules)
+    (tmp_path / 'new.yaml').write_text(new_rules)
+    old, new = PatternSentenceFilter(str(tmp_path / 'old.yaml')), PatternSentenceFilter(str(tmp_path / 'new.yaml'))
+    return [(i, s, new.is_valid(s)) for i, s in enumerate(SENTENCES) if old.is_valid(s) != new.is_valid(s)]
+
+
+def test_first_run(tmp_path):
+    outcomes, changes = refilter(tmp_path, RULES)
+    valid = [PatternSentenceFilter(str(tmp_path / 'rules.yaml')).is_valid(s) for s in SENTENCES]
+    assert outcomes.valid().tolist() == valid
+    assert changes == [(i, s, False) for i, s in enumerate(SENTENCES) if not valid[i]]
+    # chunks are rounded up to a multiple of 8 sentences
+    assert (outcomes.size, outcomes.chunk_size, len(outcomes.digests), len(outcomes.evaluated)) == (50, 16, 4, 3)
+
+
+@pytest.mark.parametrize(
+    "new_rules,evaluated",
+    [
+        (RULES, 0),  # no change
+        (RULES.replace('- lowercase:\n  descr: only lowercase', '- renamed:\n  descr: renamed'), 0),
+        (RULES.replace('min: 3', 'min: 7'), 1),  # changed
+        (RULES.replace('max: 0', 'max: 1').replace('min: 0.5', 'min: 0.3'), 2),
+        (RULES + "\n- no_x:\n  descr: no x\n  find:\n    pattern: 'x'\n    count:\n      max: 0\n", 1),  # added
+        (RULES[:RULES.index('- spaces')], 0),  # removed
+    ]
+)
+def test_refilter(tmp_path, new_rules, evaluated):
+    previous, _ = refilter(tmp_path, RULES)
+    outcomes, changes = refilter(tmp_path, new_rules, previous)
+    assert len(outcomes.evaluated) == evaluated
+    assert changes == expected_changes(tmp_path, RULES, new_rules)
+
+    # the outcomes are the same as if all the rules were evaluated
+    full, _ = refilter(tmp_path, new_rules)
+    assert outcomes.fingerprints == full.fingerprints
+    assert np.array_equal(outcomes.rejected, full.rejected)
+
+
+def test_refilter_shared_timeout(tmp_path):
+    rules = RULES + """
+- few_ab:
+  descr: few ab
+  timeout: 0.5
+  find:
+    pattern: '(a|b)+ '
+    count:
+      max: 2
+
+- no_ab:
+  descr: no ab
+  timeout: 1
+  if:
+    length:
+      max: 3
+  find:
+    pattern: '(a|b)+ '
+    count:
+      max: 0
+"""
+    previous, _ = refilter(tmp_path, rules)
+    # the shared pattern now gets a higher timeout, for both rules
+    new_rules = rules.replace('timeout: 1', 'timeout: 2')
+    outcomes, _ = refilter(tmp_path, new_rules, previous)
+    assert len(outcomes.evaluated) == 2
+    # without a timeout for the other rule, the pattern gets none
+    outcomes, _ = refilter(tmp_path, rules.replace('timeout: 1', 'timeout: null'), outcomes)
+    assert len(outcomes.evaluated) == 2
+
+
+def test_save_load(tmp_path):
+    outcomes, _ = refilter(tmp_path, RULES)
+    outcomes.save(str(tmp_path / 'state'))
+    loaded = RuleOutcomes.load(str(tmp_path / 'state'))
+    assert (loaded.fingerprints, loaded.size, loaded.chunk_size, loaded.digests) == \
+           (outcomes.fingerprints, outcomes.size, outcomes.chunk_size, outcomes.digests)
+    assert np.array_equal(loaded.rejected, outcomes.rejected)
+    assert refilter(tmp_path, RULES, loaded)[1] == []
+
+
+def test_different_sentences(tmp_path):
+    previous, _ = refilter(tmp_path, RULES)
+    with pytest.raises(ValueError):
+        refilter(tmp_path, RULES, previous, sentences=SENTENCES[:-1] + ['changed'])
+    with pytest.raises(ValueError):
+        refilter(tmp_path, RULES, previous, sentences=SENTENCES[:-1])
+    with pytest.raises(ValueError):
+        refilter(tmp_path, RULES, previous, sentences=SENTENCES + ['more'])
@@ -1,10 +1,13 @@
+import itertools
+import pickle
 import pytest
+import random
 from phrasal import MocySplitter
 
 
-@pytest.fixture
-def splitter():
-    return MocySplitter(keep_newlines=True, more=True, langs=['en'])
+@pytest.fixture(params=MocySplitter.engines)
+def splitter(request):
+    return MocySplitter(keep_newlines=True, more=True, langs=['en'], engine=request.param)
 
 
 @pytest.mark.parametrize(
@@ -50,3 +53,102 @@ def test_newline_setting(splitter):
     assert len(splitter.split(sentence)) == 2
     splitter.keep_newlines = True
     assert len(splitter.split(sentence)) == 3
+
+
+def gen_differential_corpus(n=2000, seed=42):
+    # random texts made of words, abbreviations and (lots of) punctuation, to compare the engines
+    fragments = list(' ..  .?!:;"\'()[]«»“”‘’„¿¡-/%5aAbÉé\t\n') + \
+        ['Mr.', 'No.', 'U.S.', 'i.e.', 'Jan.', 'z.B.', '1', '12.', '3.5', 'X', 'Hello', 'world', 'End.', ':-)', '1:1']
+    rnd = random.Random(seed)
+    return [''.join(rnd.choice(fragments) for _ in range(rnd.randint(1, 60))) for _ in range(n)]
+
+
+@pytest.mark.parametrize('more,keep_newlines', list(itertools.product([True, False], repeat=2)))
+def test_scan_engine(more, keep_newlines):
+    regex_splitter = MocySplitter(more=more, keep_newlines=keep_newlines)
+    scan_splitter = MocySplitter(more=more, keep_newlines=keep_newlines, engine='scan')
+    for text in gen_differential_corpus():
+        assert scan_splitter.split(text) == regex_splitter.split(text)
+
+    with pytest.raises(ValueError):
+        MocySplitter(engine='nope')
+
+
+def test_split_spans(splitter):
+    text = '  Hello   world. How are\tyou?\n\n  Fine: thanks  '
+    spans = splitter.split_spans(text)
+    assert [text[start:end] for start, end in spans] == ['Hello   world.', 'How are\tyou?', 'Fine:', 'thanks']
+    splitter.keep_newlines = False
+    assert splitter.split_spans('Hello\nworld. How\n are you?') == [(0, 12), (13, 26)]
+
+
+@pytest.mark.parametrize('keep_newlines', [True, False])
+def test_split_spans_corpus(keep_newlines):
+    normalize = lambda s: ' '.join(s.split())
+    splitter = MocySplitter(keep_newlines=keep_newlines)
+    for text in gen_differential_corpus(500):
+        spans = splitter.split_spans(text)
+        assert all(start <= end <= next_start for (start, end), (next_start, _) in zip(spans, spans[1:]))
+        assert [normalize(text[start:end]) for start, end in spans] == [normalize(s) for s in splitter.split(text)]
+
+
+@pytest.mark.parametrize('keep_newlines', [True, False])
+def test_iter_split(keep_newlines):
+    splitter = MocySplitter(keep_newlines=keep_newlines)
+    for text in gen_differential_corpus(500):
+        expected = splitter.split(text)
+        assert list(splitter.iter_split(text)) == expected
+        assert list(splitter.iter_split(text.splitlines(keepends=True))) == expected
+        assert list(splitter.iter_split(iter(text.split('\n')))) == expected
+
+
+def test_nb_prefixes_cache():
+    splitter = MocySplitter(langs=['en'])
+    assert MocySplitter(langs=['en']).nb_prefixes == splitter.nb_prefixes
+    assert MocySplitter(langs=['en', 'de']).nb_prefixes != splitter.nb_prefixes
+    # each splitter gets its own copy of the cached table
+    splitter.nb_prefixes['Nope'] = 1
+    assert splitter.split('Nope. Yes.') == ['Nope. Yes.']
+    assert 'Nope' not in MocySplitter(langs=['en']).nb_prefixes
+    assert pickle.loads(pickle.dumps(splitter)).nb_prefixes == splitter.nb_prefixes
+
+
+def test_prefix_file(tmp_path):
+    prefix_file = tmp_path / 'prefixes.txt'
+    prefix_file.write_text('# comment\n\nNope\nNum #NUMERIC_ONLY#\n')
+    splitter = MocySplitter(prefix_file=str(prefix_file))
+    assert splitter.nb_prefixes == {'Nope': 1, 'Num': 2}
+    assert splitter.split('Nope. Yes. Num. 2 Num. Yes. Mr. Yes.') == ['Nope. Yes.', 'Num. 2 Num.', 'Yes.', 'Mr.', 'Yes.']
+
+    # the cached table is read again when the file changes
+    prefix_file.write_text('Mr\n')
+    assert MocySplitter(prefix_file=str(prefix_file)).nb_prefixes == {'Mr': 1}
+
+
+@pytest.mark.parametrize('keep_newlines', [True, False])
+def test_paragraph_cache(keep_newlines):
+    splitter = MocySplitter(keep_newlines=keep_newlines)
+    cached_splitter = MocySplitter(keep_newlines=keep_newlines, cache_size=10_000)
+    corpus = gen_differential_corpus(300)
+    for text in corpus + corpus:
+        assert cached_splitter.split(text) == splitter.split(text)
+    stats = cached_splitter.cache.stats()
+    assert stats['entries'] == stats['misses'] and stats['hits'] >= stats['misses']
+
+    # replacing the prefixes clears the cache
+    text = 'I met Mr. Smith.'
+    assert cached_splitter.split(text) == [text]
+    cached_splitter.nb_prefixes = dict()
+    assert cached_splitter.split(text) == ['I met Mr.', 'Smith.'] and len(cached_splitter.cache) == 1
+
+    small_splitter = MocySplitter(keep_newlines=keep_newlines, cache_size=10)
+    assert small_splitter.split_all(corpus) == splitter.split_all(corpus)
+    assert len(small_splitter.cache) == 10
+
+
+@pytest.mark.parametrize('keep_newlines', [True, False])
+def test_split_parallel(keep_newlines):
+    splitter = MocySplitter(keep_newlines=keep_newlines)
+    text = '\n'.join(gen_differential_corpus(500))
+    assert splitter.split(text, workers=3) == splitter.split(text)
+    assert splitter.split('Short. Text.', workers=2) == ['Short.', 'Text.']
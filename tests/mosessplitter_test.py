@@ -0,0 +1,26 @@
+from phrasal import MosesSplitter
+
+
+def test_prefix_file(tmp_path):
+    prefix_file = tmp_path / 'prefixes.txt'
+    prefix_file.write_text('# comment\n\nNope\nNum #NUMERIC_ONLY#\n')
+    splitter = MosesSplitter(prefix_file=str(prefix_file))
+    assert splitter.nb_prefixes == {'Nope': 1, 'Num': 2}
+    assert splitter.split('Nope. Yes. Num. 2 Num. Yes. Mr. Yes.') == ['Nope. Yes.', 'Num. 2 Num.', 'Yes.', 'Mr.', 'Yes.']
+
+    # each splitter gets its own copy of the cached table
+    splitter.nb_prefixes['Mr'] = 1
+    assert splitter.split('Mr. Yes.') == ['Mr. Yes.']
+    assert 'Mr' not in MosesSplitter(prefix_file=str(prefix_file)).nb_prefixes
+
+    # the cached table is read again when the file changes
+    prefix_file.write_text('Mr\n')
+    assert MosesSplitter(prefix_file=str(prefix_file)).nb_prefixes == {'Mr': 1}
+
+
+def test_default_prefix_files():
+    # regression: the default file used to be derived from the module path, and moses_splitter.py itself was parsed
+    for lang, prefix in [('en', 'Mr'), ('de', 'bzw'), ('xx', 'Mr')]:  # unknown languages fall back to English
+        assert MosesSplitter(lang=lang).nb_prefixes.get(prefix) == 1
+    assert MosesSplitter(lang='en').split('Mr. Smith is here. He called No. 5 today.') == \
+           ['Mr. Smith is here.', 'He called No. 5 today.']
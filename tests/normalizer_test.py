@@ -1,5 +1,11 @@
+import itertools
+import json
+import os
 import pytest
 import random
+import re
+import shutil
+import subprocess
 from phrasal import norm_punc
 
 test_cases = [
@@ -69,3 +75,159 @@ def test_normalizer_single(raw, expected):
 def test_normalizer_shuffled(raw, expected):
     res = norm_punc.normalize_text(str(raw), fix_encoding=False, strip_emojis=False)
     assert res == str(expected)
+
+
+def normalize_text_reference(text, strip_emojis=False):
+    # the original implementation, applying each pattern of norm_punc.normalization_patterns one after the other
+    import re, unicodedata
+    spaces_pattern = re.compile('[\u00A0\u1680\u2000-\u200A\u202F\u205F\u3000 ]+')
+    text = unicodedata.normalize('NFC', text)
+    if strip_emojis:
+        text = norm_punc.emoji_pattern.sub(' ', text)
+    for typ, pattern, replace in norm_punc.normalization_patterns:
+        if pattern is norm_punc.spaces_pattern:
+            text = spaces_pattern.sub(replace, text)
+        elif typ == norm_punc.REG:
+            text = pattern.sub(replace, text)
+        else:
+            text = text.replace(pattern, replace)
+    text = spaces_pattern.sub(' ', text)
+    text = re.sub(r'(^|\n)\s+', r'\1', text)
+    return re.sub(r'\s+(\n|$)', r'\1', text)
+
+
+def gen_differential_corpus(n=2000, seed=42):
+    rnd = random.Random(seed)
+    # all the literals and characters found in the rules, plus some regular text, German, emojis and edge cases
+    fragments = [p for t, p, _ in norm_punc.normalization_patterns if t == norm_punc.STR]
+    fragments += list('\u00A0\u2005\u3000\u200d\u0301\u0308\uFE0F\uFFFD\u0084\u2028\u2013\t\r\n %:;.,()"\'<>0123456789')
+    fragments += ['Grüezi', 'mitenand', 'Straße', 'über', 'Äpfel', 'hello', 'World', '😀', '👍🏽', '☕', 'x' * 3, ' ' * 3]
+    for _ in range(n):
+        yield ''.join(rnd.choice(fragments) for _ in range(rnd.randint(0, 40)))
+
+
+def gen_ascii_corpus(n=500, seed=42):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        yield ''.join(rnd.choice('ab 0.,:;%()"\'\t\n') for _ in range(rnd.randint(0, 40)))
+
+
+@pytest.mark.parametrize("strip_emojis", [False, True])
+def test_normalizer_compiled_patterns(strip_emojis):
+    assert len(norm_punc.compiled_patterns) <= len(norm_punc.normalization_patterns)
+    for raw in itertools.chain(gen_differential_corpus(), gen_ascii_corpus()):
+        assert norm_punc.normalize_text(raw, strip_emojis=strip_emojis) == \
+               normalize_text_reference(raw, strip_emojis=strip_emojis), repr(raw)
+
+
+@pytest.mark.parametrize("pattern,text", [('(?i)abc', 'ABC'), ('abc', 'ABC'), ('x(?i:b)', 'xB'), ('(?i:a)b', 'Ab')])
+def test_normalizer_ignorecase_triggers(pattern, text):
+    # patterns are skipped based on the characters they require, which doesn't work if the case is ignored
+    patterns = norm_punc.compile_patterns([(norm_punc.REG, re.compile(pattern), '-')])
+    assert norm_punc.apply_patterns(text, patterns, set(text)) == re.sub(pattern, '-', text)
+
+
+def test_import_oldest_python():
+    # the normalization patterns are compiled (and analyzed) at import time
+    python = shutil.which('python3.6')
+    if python is None or subprocess.run([python, '--version'], stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL).returncode != 0:  # e.g. an inactive pyenv shim
+        pytest.skip('python3.6 not found')
+    src = os.path.join(os.path.dirname(__file__), os.pardir, 'src')
+    result = subprocess.run([python, '-c', 'import phrasal'], env=dict(os.environ, PYTHONPATH=src),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if 'ModuleNotFoundError' in result.stderr:
+        pytest.skip('dependencies missing for python3.6')
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 50, 1 << 20])
+def test_normalizer_stream(chunk_size):
+    rnd = random.Random(chunk_size)
+    text = '\n'.join(gen_differential_corpus(500)) + '\n\n'
+    # feed pieces of random sizes, not aligned on lines
+    cuts = sorted(rnd.sample(range(len(text)), 300))
+    pieces = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+    expected = norm_punc.normalize_text(text, strip_emojis=True)
+    assert ''.join(norm_punc.normalize_stream(pieces, chunk_size, strip_emojis=True)) == expected
+    assert ''.join(norm_punc.Normalizer(strip_emojis=True).normalize_stream(text.splitlines(True), chunk_size)) == expected
+
+
+def test_normalizer_parallel():
+    normalizer = norm_punc.Normalizer(strip_emojis=True)
+    texts = list(gen_differential_corpus(300))
+    expected = [norm_punc.normalize_text(t, strip_emojis=True) for t in texts]
+    assert normalizer.normalize_all(texts, workers=2, chunksize=16) == expected
+    assert sorted(normalizer.imap_normalize(iter(texts), workers=2, ordered=False)) == sorted(expected)
+    assert normalizer.normalize_all(texts, workers=2, strip_emojis=False) == \
+           [norm_punc.normalize_text(t) for t in texts]
+
+
+def test_normalizer_cache():
+    normalizer = norm_punc.Normalizer(cache_size=200, cache_bytes=20_000, strip_emojis=True)
+    lines = list(gen_differential_corpus(300))
+    rnd = random.Random(0)
+    for _ in range(50):
+        text = '\n'.join(rnd.choice(lines) for _ in range(20))
+        assert normalizer.normalize(text) == norm_punc.normalize_text(text, strip_emojis=True), repr(text)
+        assert normalizer.normalize(text, strip_emojis=False) == norm_punc.normalize_text(text), repr(text)
+    stats = normalizer.cache.stats()
+    assert stats['hits'] > 0 and stats['misses'] > 0
+    assert stats['entries'] <= 200 and stats['bytes'] <= 20_000
+
+
+def test_normalizer_profile():
+    profile = norm_punc.PatternsProfile()
+    normalizer = norm_punc.Normalizer(profile=profile)
+    for raw, expected in test_cases:
+        assert normalizer.normalize(raw) == expected
+    assert len(profile.stats) == len(norm_punc.compiled_patterns)
+    assert all(stats['calls'] == len(test_cases) for stats in profile.stats.values())
+    stats = {p.pattern: profile.stats[profile.describe(i, p)] for i, p in enumerate(norm_punc.compiled_patterns)}
+    assert stats['…']['changed'] == 0 and stats['…']['skipped'] == len(test_cases)
+    assert stats['\u00AD']['changed'] == 1 and stats['\u00AD']['chars'] == 6
+
+    merged = norm_punc.PatternsProfile()
+    merged.merge(profile)
+    merged.merge(profile)
+    assert merged.stats[profile.describe(1, norm_punc.compiled_patterns[1])]['calls'] == 2 * len(test_cases)
+    assert json.loads(merged.to_json())[0]['rule'] == profile.describe(0, norm_punc.compiled_patterns[0])
+
+
+def test_normalizer_profile_parallel():
+    texts = list(gen_differential_corpus(100))
+    expected = norm_punc.PatternsProfile()
+    norm_punc.Normalizer(profile=expected).normalize_all(texts)
+
+    profile = norm_punc.PatternsProfile()
+    profile.merge(expected)  # statistics collected before are kept, not sent to the workers
+    assert norm_punc.Normalizer(profile=profile).normalize_all(texts, workers=2, chunksize=16) == \
+           [norm_punc.normalize_text(t) for t in texts]
+    for rule, stats in expected.stats.items():
+        for k in ['calls', 'skipped', 'changed', 'chars']:
+            assert profile.stats[rule][k] == 2 * stats[k], (rule, k)
+
+
+@pytest.mark.parametrize('groups', [['quotes'], ['spaces'], ['control', 'dashes', 'numbers'], []])
+def test_normalizer_groups(groups):
+    rules = [(t, r, s) for (t, r, s, g) in norm_punc.normalization_rules if g in groups]
+    if 'spaces' in groups:
+        rules.append((norm_punc.REG, norm_punc.spaces_pattern, ' '))
+    normalizer = norm_punc.Normalizer(groups=groups)
+    for text in gen_differential_corpus(500):
+        expected = norm_punc.strip_lines(norm_punc.apply_patterns(
+            norm_punc.unicodedata.normalize('NFC', text), norm_punc.compile_patterns(rules)))
+        assert normalizer.normalize(text) == expected
+        assert norm_punc.normalize_text(text, groups=groups) == expected
+
+
+def test_normalizer_specialized():
+    normalizer = norm_punc.Normalizer(strip_emojis=True, cache_size=100)
+    for text in gen_differential_corpus(500):
+        assert normalizer.normalize(text) == norm_punc.normalize_text(text, strip_emojis=True)
+        # overriding options falls back to the generic path
+        assert normalizer.normalize(text, strip_emojis=False, groups=['quotes']) == \
+            norm_punc.normalize_text(text, groups=['quotes'])
+
+    with pytest.raises(ValueError):
+        norm_punc.Normalizer(groups=['quotes', 'nope'])
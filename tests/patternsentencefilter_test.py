@@ -1,6 +1,11 @@
+import json
+import os
 import pytest
 import pytest_check as check
+import regex
 from phrasal import PatternSentenceFilter
+from phrasal.filterers.pattern_sentence_filter import BatchFeatures, RuleStats, Rules, SentenceFeatures, \
+    count_matches, parse_char_class
 
 
 @pytest.fixture
@@ -27,3 +32,252 @@ def test_rules():
 )
 def test_custom_rules(custom_rules_filterer, sentence, valid):
     assert custom_rules_filterer.is_valid(sentence) == valid
+
+
+@pytest.mark.parametrize("pattern", [r'\p{L}+', r'(\.\s?){3}$', r'(a)(b)?', r'x*', r'(^|\s)\p{L}{1,6}(\s|$)'])
+@pytest.mark.parametrize("sentence", ['', 'a b ab abb', 'Grüezi mitenand...', 'x xx  xxx. . .'])
+def test_count_matches(pattern, sentence):
+    compiled = regex.compile(pattern)
+    assert count_matches(compiled, sentence) == len(compiled.findall(sentence))
+
+
+def test_shared_patterns():
+    rules = Rules([
+        dict(descr='words', find=dict(pattern=r'\p{L}+', count=dict(min=2))),
+        dict(descr='commas', compare=dict(num=',', denom=r'\p{L}+', ratio=dict(max=0.75))),
+        dict(descr='short', **{'if': dict(pattern=dict(pattern=',', count=dict(max=0)))},
+             length=dict(min=5)),
+    ])
+    # each distinct pattern is counted once per sentence, no matter how many rules use it
+    assert [p.pattern for p in rules.patterns] == [r'\p{L}+', ',']
+
+    features = SentenceFeatures('a, b, c, d')
+    assert not any(r.is_invalid(features.sentence, features) for r in rules)
+    assert features.counts == {rules.patterns[0]: 4, rules.patterns[1]: 3}
+    assert rules.is_invalid('a,,, b') and not rules.is_invalid('ab cd')
+
+
+@pytest.mark.parametrize("limit", [None, 0, 1, 2, 5])
+def test_count_matches_limit(limit):
+    pattern = regex.compile(r'\p{L}+')
+    for sentence in ['', 'one', 'one two three', 'a b c d e f g']:
+        count = len(pattern.findall(sentence))
+        assert count_matches(pattern, sentence, limit) == (count if limit is None else min(count, limit))
+
+
+def test_count_limits():
+    rules = Rules([
+        dict(descr='no dots', find=dict(pattern=r'\.', count=dict(max=0))),
+        dict(descr='few dots', find=dict(pattern=r'\.', count=dict(max=3))),
+        dict(descr='words', find=dict(pattern=r'\p{L}+', count=dict(min=2))),
+        dict(descr='commas', find=dict(pattern=',', count=dict(min=1, max=2))),
+        dict(descr='comma ratio', compare=dict(num=',', denom=r'\p{L}+', ratio=dict(max=1))),
+        dict(descr='long enough', length=dict(min=3)),
+    ])
+    # the highest limit is used for a pattern shared by several rules, none if one needs the full count
+    assert [r.logic.limit for r in rules[:4]] == [4, 4, None, None]
+    # length-based rules are checked first
+    assert rules.plan[0].descr == 'long enough'
+
+
+def test_adaptive_ordering():
+    sentences = ['a a b b', 'A a b b', 'aabb', 'a', '', 'a b c d e f g'] * 50
+    rules = [
+        dict(descr='letters', find=dict(pattern='[a-z]', count=dict(min=1))),
+        dict(descr='no caps', find=dict(pattern='[A-Z]', count=dict(max=0))),
+        dict(descr='no digits', find=dict(pattern='[0-9]', count=dict(max=0))),
+        dict(descr='spaces', length=dict(min=2)),
+    ]
+    expected = [not Rules(rules).is_invalid(s) for s in sentences]
+
+    adaptive = Rules(rules, adaptive=True)
+    adaptive.sample_every, adaptive.reorder_every = 2, 10
+    assert [not adaptive.is_invalid(s) for s in sentences] == expected
+    assert sorted(r.id for r in adaptive.plan) == [1, 2, 3, 4]
+
+    optimized = Rules(rules)
+    optimized.optimize(sentences)
+    assert [not optimized.is_invalid(s) for s in sentences] == expected
+    # rules that never reject anything are checked last
+    assert optimized.plan[-1].descr == 'no digits'
+
+
+def test_filter_adaptive():
+    sentences = ['a a b b', 'a ', 'a', 'A a b b', 'aabb', ''] * 50
+    expected = [s for s in sentences if PatternSentenceFilter(rulespath=__file__.replace('.py', '.yaml')).is_valid(s)]
+    filterer = PatternSentenceFilter(rulespath=__file__.replace('.py', '.yaml'), adaptive=True)
+    # filter doesn't use filter_batch with adaptive ordering: the rules are still measured and reordered
+    assert list(filterer.filter(sentences)) == expected
+    assert sum(filterer.rules.rejections.values()) > 0
+
+
+def test_stats():
+    sentences = ['a a b b', 'a ', 'a', 'A a b b', 'aabb', '']
+    filterer = PatternSentenceFilter(rulespath=__file__.replace('.py', '.yaml'), stats=True)
+    assert [filterer.is_valid(s) for s in sentences] == [True, True, False, False, False, False]
+
+    stats = filterer.stats
+    assert (stats.sentences, stats.rejected) == (6, 4)
+    # all rules are evaluated on every sentence
+    assert all(r['evaluations'] == 6 and r['skips'] == 0 for r in stats.rules.values())
+    assert [(r['rejections'], r['first_rejections']) for r in stats.rules.values()] == [(1, 1), (1, 1), (3, 2)]
+
+    # stats can be merged and exported as JSON
+    merged = RuleStats.from_json(stats.to_json()).merge(stats)
+    assert (merged.sentences, merged.rejected) == (12, 8)
+    assert merged.rules[3]['rejections'] == 6 and merged.rules[3]['descr'] == 'space ratio'
+    stats.clear()
+    assert stats.sentences == 0 and stats.rules[3]['time'] == 0
+
+
+def test_stats_sampling():
+    filterer = PatternSentenceFilter(stats=5)
+    sentences = ['Hüt isch es schön gsi, mir gönd uf de Üetliberg.', 'nope'] * 10
+    assert [filterer.is_valid(s) for s in sentences] == [True, False] * 10
+    assert filterer.stats.sentences == 4
+
+
+@pytest.mark.parametrize("stats", [False, True])
+@pytest.mark.parametrize("on_timeout,valid", [('reject', False), ('accept', True), ('skip', True)])
+def test_timeout(on_timeout, valid, stats):
+    rules = Rules([
+        dict(descr='letters', find=dict(pattern='[a-z]+', count=dict(min=1))),
+        dict(descr='backtracking', find=dict(pattern='(a|aa)+b', count=dict(max=0))),
+        dict(descr='backtracking too', timeout=0.02, find=dict(pattern='(a|aa)+b', count=dict(max=1))),
+    ], stats=stats, timeout=0.01, on_timeout=on_timeout)
+    # patterns of a single character class can't backtrack: no timeout, the highest one for shared patterns
+    assert list(rules.pattern_timeouts.values()) == [0.02]
+
+    assert rules.is_invalid('aab') and not rules.is_invalid('aaa')
+    assert rules.is_invalid('a' * 50) != valid
+    # the pattern is only counted once, but the timeout counts for every rule evaluated
+    assert rules.timeouts == {1: 0, 2: 1, 3: int(valid or stats)}
+    if stats:
+        assert rules.stats.rules[2]['timeouts'] == 1
+        assert rules.stats.rules[2]['skips'] == (on_timeout == 'skip')
+        assert rules.stats.rules[2]['rejections'] == 1 + (on_timeout == 'reject')
+
+    with pytest.raises(ValueError):
+        Rules([], on_timeout='retry')
+
+
+def test_rule_bundle(tmp_path):
+    rulespath = str(tmp_path / 'rules.yaml')
+    with open(__file__.replace('.py', '.yaml')) as src, open(rulespath, 'w') as dst:
+        dst.write(f'# {tmp_path}\n{src.read()}')  # unique content, not to share the rules with other tests
+
+    # nothing is written to disk without a cache directory
+    filterer = PatternSentenceFilter(rulespath)
+    assert os.listdir(tmp_path) == ['rules.yaml']
+    # rules are shared in the process (for the same options), but not their state
+    for kwargs in [dict(), dict(stats=True), dict(adaptive=True)]:
+        other = PatternSentenceFilter(rulespath, **kwargs).rules
+        assert other.rules is filterer.rules.rules and other is not filterer.rules
+    for kwargs in [dict(timeout=1), dict(cache=False)]:
+        assert PatternSentenceFilter(rulespath, **kwargs).rules.rules is not filterer.rules.rules
+    other = PatternSentenceFilter(rulespath)
+    other.rules.optimize(['a a b b', 'aabb', 'A a b b'] * 10)
+    other.rules.timeouts[1] = 1
+    assert filterer.rules.plan != other.rules.plan and filterer.rules.timeouts[1] == 0
+    assert PatternSentenceFilter(rulespath).rules.plan == filterer.rules.plan
+
+    # the bundle is only read (and written) if the rules are not in memory already
+    cache_dir = tmp_path / 'cache'
+    Rules._shared.clear()
+    filterer = PatternSentenceFilter(rulespath, cache_dir=str(cache_dir))
+    [bundlepath] = cache_dir.glob('*.json')
+    bundle = json.loads(bundlepath.read_text())
+    assert bundlepath.name == bundle['key'] + '.json'
+    assert len(bundle['rules']) == len(filterer.rules) and len(bundle['patterns']) == len(filterer.rules.patterns)
+
+    # the bundle is ignored if it is corrupted, and another one is used if the rules changed
+    bundlepath.write_text('{"key": "garbage"')
+    Rules._shared.clear()
+    assert len(PatternSentenceFilter(rulespath, cache_dir=str(cache_dir)).rules) == len(filterer.rules)
+    assert json.loads(bundlepath.read_text())['key'] == bundle['key']
+    with open(rulespath, 'a') as f:
+        f.write("\n\n- max_length:\n  descr: too long\n  length:\n    max: 5\n")
+    changed = PatternSentenceFilter(rulespath, cache_dir=str(cache_dir))
+    assert len(changed.rules) == len(filterer.rules) + 1
+    assert filterer.is_valid('a a b b') and not changed.is_valid('a a b b')
+    [new_bundlepath] = set(cache_dir.glob('*.json')) - {bundlepath}
+    assert json.loads(new_bundlepath.read_text())['rules'][-1]['descr'] == 'too long'
+    assert sorted(os.listdir(tmp_path)) == ['cache', 'rules.yaml']
+
+
+def test_lint():
+    rules = Rules([
+        dict(descr='nested', find=dict(pattern=r'(\p{L}+\s?)+!', count=dict(max=0))),
+        dict(descr='possessive', find=dict(pattern=r'(\p{L}++ )+!', count=dict(max=0))),
+    ])
+    assert len(rules[0].lint()) == 1 and not rules[0].self_check(verbose=False)
+    assert rules[1].lint() == [] and rules[1].self_check(verbose=False)
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        (r'\p{L}', (r'\p{L}', 1, 1)),
+        (r'\p{L}+', (r'\p{L}', 1, None)),
+        (r'[/\)&:{]', (r'[/\)&:{]', 1, 1)),
+        (r'[\p{L}#]{30,}', (r'[\p{L}#]', 30, None)),
+        (r'\s{2,4}', (r'\s', 2, 4)),
+        (r'\.{3}', (r'\.', 3, 3)),
+        (r'\t|\s{4,}', None),
+        (r'\p{L}+?', None),
+        (r'a*', None),
+        (r'ab', None),
+        (r'\b', None),
+        (r'([^?!])\1{8}', None),
+    ]
+)
+def test_parse_char_class(pattern, expected):
+    parsed = parse_char_class(pattern)
+    assert (parsed if parsed is None else (parsed[0].pattern, *parsed[1:])) == expected
+
+
+def test_batch_features():
+    pytest.importorskip('numpy')
+    sentences = ['', 'Grüezi mitenand...', 'a  b\t\tc', ' x', '😀😀 ab abc abcd', 'aaaaaaa aaaaa']
+    features = BatchFeatures(sentences)
+    for pattern in [r'\p{L}', r'\p{L}+', r'\s', r'\s{2,}', r'\p{L}{2}', r'a{2,3}', r'[^\p{L}]+', '.']:
+        counts = features.count(pattern, parse_char_class(pattern))
+        assert counts.tolist() == [len(regex.findall(pattern, s)) for s in sentences], pattern
+
+
+def test_filter_batch(custom_rules_filterer):
+    pytest.importorskip('numpy')
+    sentences = ['a a b b', 'a ', 'a', 'A a b b', 'aabb', '', 'Hüt isch es schön gsi, mir gönd uf de Üetliberg.',
+                 'Home | News | Kontakt', 'http://example.com is so nice, go see it please', 'Jaaaaaaaaaaaa klar!',
+                 'De Zürcher Schtadtrat Gerold Lauber und de Diräkter vom Schportamt Züri', 'Mal luege, ob/wänn..']
+    for filterer in [custom_rules_filterer, PatternSentenceFilter()]:
+        expected = [filterer.is_valid(s) for s in sentences]
+        assert filterer.filter_batch(sentences).tolist() == expected
+        assert list(filterer.filter(sentences)) == [s for s, valid in zip(sentences, expected) if valid]
+
+    # filter checks chunks of sentences: same result across chunk boundaries, and the input is consumed lazily
+    filterer = PatternSentenceFilter()
+    filterer.chunk_size = 5
+    expected = [s for s in sentences if filterer.is_valid(s)]
+    assert list(filterer.filter(iter(sentences))) == expected
+    consumed = []
+    filtered = filterer.filter(consumed.append(s) or s for s in sentences)
+    assert next(filtered) == expected[0] and len(consumed) == (sentences.index(expected[0]) // 5 + 1) * 5
+
+
+def test_features(custom_rules_filterer):
+    pytest.importorskip('numpy')
+    sentences = ['a a b b', 'a ', 'a', 'A a b b', 'aabb', '', 'Hüt isch es schön gsi, mir gönd uf de Üetliberg.',
+                 'Home | News | Kontakt', 'http://example.com is so nice, go see it please', 'Jaaaaaaaaaaaa klar!']
+    matrix = custom_rules_filterer.features(sentences)
+    assert custom_rules_filterer.feature_names == ['1.length', '2.count', '3.ratio']
+    assert matrix.tolist() == [[len(s), len(regex.findall('[^a-z ]', s)), s.count(' ') / (len(s) - s.count(' ') + 1)]
+                               for s in sentences]
+
+    # patterns counted on the whole batch or one sentence at a time give the same metrics
+    filterer = PatternSentenceFilter()
+    matrix = filterer.features(sentences)
+    assert matrix.shape == (len(sentences), len(filterer.feature_names))
+    for idx, s in enumerate(sentences):
+        expected = [v for r in filterer.rules for v in r.logic.measure(s, SentenceFeatures(s))]
+        assert matrix[idx].tolist() == pytest.approx(expected), s
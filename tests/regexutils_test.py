@@ -0,0 +1,167 @@
+import ast
+import json
+import os
+import pickle
+import random
+import re
+
+import pytest
+import regex
+import yaml
+
+from phrasal import regex_utils
+from phrasal.regex_utils import compile_pattern, dump_compiled, load_compiled, nested_quantifiers, translate
+
+RE_PATTERN = type(re.compile(''))  # re.Pattern requires Python 3.7
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src', 'phrasal')
+
+
+def _splitter_patterns():
+    # the pattern strings passed to compile_pattern in the splitter modules
+    for module in ['mocy_splitter.py', 'moses_splitter.py']:
+        with open(os.path.join(SRC_DIR, 'splitters', module), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'compile_pattern':
+                yield ast.literal_eval(node.args[0])
+
+
+def _filter_patterns():
+    # the patterns of the shipped filter rules
+    with open(os.path.join(SRC_DIR, 'filterers', 'pattern_sentence_filter.yaml'), encoding='utf-8') as f:
+        for rule in yaml.safe_load(f):
+            for logic in [rule, rule.get('if', {})]:
+                yield from [logic['find']['pattern']] if 'find' in logic else []
+                yield from [logic['compare']['num'], logic['compare']['denom']] if 'compare' in logic else []
+
+
+def _corpus(n=500, seed=0):
+    # random strings mixing ascii, accents, (unicode) spaces and digits, punctuation, other scripts and emojis
+    pools = [
+        ''.join(chr(c) for c in range(0x20, 0x7f)) + '\t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0',
+        'äöüÄÖÜéèàçßÆØÅ«»‹›„“”‘’‚¿¡…–—―−﹘－¯‐·§©®°',
+        '        　᠎​﻿',
+        '٠١٢٣٤٥٦٧٨٩०१२३४५६७८९௧௨¹²³½ⅠⅡ',
+        '漢字かなカナ한국어ΑΒΓαβγДЖЯджя',
+        '😀👍🏽❤️🌍\U0001d400\U0001d7ce\U00010400',
+        '()[]{}⟨⟩「」『』〈〉《》（）',
+    ]
+    rnd = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        pool = ''.join(rnd.sample(pools, rnd.randint(1, len(pools))))
+        corpus.append(''.join(rnd.choice(pool) for _ in range(rnd.randint(0, 60))))
+    return corpus
+
+
+CORPUS = _corpus()
+
+
+@pytest.mark.parametrize(
+    'pattern',
+    sorted(set(_splitter_patterns()) | set(_filter_patterns())) +
+    [r'\s*', r'x*', r'(?<=a)\s?', r'\d+', r'\D', r'\S+', r'(\.\s?){3}$', r'^\s', r'[\s\d]+', r'(a)\1', r'\x41ä']
+)
+def test_translate_exact(pattern):
+    translated = translate(pattern)
+    if translated is None:
+        pytest.skip('not translatable')
+    expected, actual = regex.compile(pattern), re.compile(translated)
+    for s in CORPUS:
+        assert expected.findall(s) == actual.findall(s), s
+        assert expected.subn('#', s) == actual.subn('#', s), s
+
+
+def test_translate_shipped_patterns():
+    # most splitter patterns use small unicode classes (\p{Pf}, \p{Pi}...) and should be translatable
+    assert translate(r'[\'\"\)\]\p{Pf}]+ ') is not None
+    assert translate(r'[^\?!\p{Pe}\p{Pf}\"]') is not None
+    assert sum(translate(p) is not None for p in _filter_patterns()) > 0
+
+
+@pytest.mark.parametrize(
+    'pattern',
+    [
+        r'\p{L}+',  # too large
+        r'[\P{Pf}a]',  # negated class in a set
+        r'\w+', r'\bword\b', r'\Aa', r'\X',  # different semantics
+        r'(?i)a', r'a++', r'(?>a)', r'[[:alpha:]]', r'[]a]',  # unsupported syntax
+        r'(?<=a+)b',  # variable-width look-behind
+        '\\',
+    ]
+)
+def test_translate_unsupported(pattern):
+    assert translate(pattern) is None
+
+
+def test_compile_pattern():
+    assert isinstance(compile_pattern(r'\p{L}+').compiled(), regex.Pattern)
+    # the engine only depends on the pattern: re whenever it can be translated
+    assert isinstance(compile_pattern(r'[\p{Pf}]').compiled(), RE_PATTERN)
+    assert isinstance(compile_pattern(r'[0-9]+').compiled(), RE_PATTERN)
+    assert isinstance(compile_pattern(r'[\p{Pf}]', engine='re').compiled(), RE_PATTERN)
+    assert isinstance(compile_pattern(r'[\p{Pf}]', engine='regex').compiled(), regex.Pattern)
+    assert isinstance(compile_pattern(r'[\p{Pf}]', flags=regex.IGNORECASE, engine='re').compiled(), regex.Pattern)
+    for engine in ['re', 'regex']:
+        assert compile_pattern(r'[\p{Pf}]+', engine=engine).findall('a »» b ”') == ['»»', '”']
+    for engine in ['pcre', 'auto']:
+        with pytest.raises(ValueError):
+            compile_pattern('a', engine=engine)
+
+
+def test_class_items():
+    # the characters of the classes used by the patterns not compiled yet are found at the same time
+    pending = compile_pattern(r'[\p{Sk}] pending'), compile_pattern(r'\P{Sm}x'), compile_pattern(r'\p{Nope}')
+    assert compile_pattern(r'[\p{Sc}] now').sub('', '$ now') == ''
+    assert all(e in regex_utils._class_items_cache for e in [r'\p{Sc}', r'\p{Sk}', r'\p{Sm}'])
+    assert pending[0]._compiled is None and r'\p{Nope}' not in regex_utils._class_items_cache
+    with pytest.raises(regex.error):
+        pending[2].compiled()
+
+
+def test_lazy_pattern():
+    pattern = compile_pattern(r'[\p{Pi}]+ lazy')
+    assert pattern._compiled is None  # not translated nor compiled until used
+    assert pattern.sub('', '«« lazy test') == ' test'
+    assert pattern._compiled is not None and pattern.pattern == pattern.compiled().pattern
+    assert pickle.loads(pickle.dumps(pattern)) is pattern
+
+
+def test_dump_compiled():
+    patterns = [compile_pattern(r'[\p{Pf}]+ '), compile_pattern(r'\p{L}+'), compile_pattern('a', flags=regex.I)]
+    # compiled patterns are cached
+    assert compile_pattern(r'\p{L}+') is patterns[1]
+    # other tests may have compiled the same patterns with another engine, hence the (pattern, flags, engine) keys
+    entries = {tuple(e[:3]): e for e in dump_compiled(patterns)}
+    keys = [(r'[\p{Pf}]+ ', 0, 're'), (r'\p{L}+', 0, 're'), ('a', regex.I, 're')]
+    assert all(key in entries for key in keys)
+    assert entries[keys[1]][3] == 'regex'
+
+    # pretend the patterns were never compiled: they are compiled exactly the same, without translation
+    for key in keys:
+        del regex_utils._compiled[key]
+    load_compiled(json.loads(json.dumps([entries[key] for key in keys])))
+    loaded = [compile_pattern(r'[\p{Pf}]+ '), compile_pattern(r'\p{L}+'), compile_pattern('a', flags=regex.I)]
+    assert [(type(p.compiled()), p.pattern, p.flags) for p in loaded] == \
+           [(type(p.compiled()), p.pattern, p.flags) for p in patterns]
+
+
+@pytest.mark.parametrize(
+    'pattern,expected',
+    [
+        (r'(a+)+', ['(a+)+']),
+        (r'(\w+\s?)*$', [r'(\w+\s?)*']),
+        (r'x((ab)+c){2,}', ['((ab)+c){2,}']),
+        (r'(?:a*)+?', ['(?:a*)+?']),
+        (r'(a{2,5})+', ['(a{2,5})+']),
+        (r'(\.\s?){3}$', []),  # bounded
+        (r'(a{2})+', []),  # fixed repetition
+        (r'(a++b)+', []),  # possessive
+        (r'(\p{L}+[/-]){3,}', ['(\\p{L}+[/-]){3,}']),
+        (r'([a+]b)+', []),
+        (r'\(a+\)+', []),
+        (r'(?<=a+)(b)+', []),
+    ]
+)
+def test_nested_quantifiers(pattern, expected):
+    assert nested_quantifiers(pattern) == expected